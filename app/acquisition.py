@@ -0,0 +1,159 @@
+"""
+acquisition.py runs data acquisition from the WLAN box outside of the event loop.
+Blocking PLC reads never run on the event loop, the loop only consumes the frames produced here.
+"""
+import queue
+import threading
+from time import monotonic
+
+from connection import ConnectionState
+
+
+class FrameQueue:
+    """
+    Bounded handoff queue between acquisition and the event loop.
+    If the consumer falls behind, the oldest frames are dropped.
+    """
+
+    def __init__(self, loop, frame_ready, queue_size=10) -> None:
+        super().__init__()
+        self.loop = loop
+        self.frame_ready = frame_ready
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.dropped_frames = 0
+        # monotonic time of the last frame or of the last successful liveness probe, None before the first one
+        self.alive_at = None
+
+    def put(self, frame):
+        """
+        Timestamp frame and put it into the queue, dropping the oldest frame if the queue is full,
+        and wake up the consumer. Can be called from any thread.
+
+        :param frame: frame as returned by the data source
+        :return: None
+        """
+        frame['acquired_at'] = self.alive_at = monotonic()
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                break
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped_frames += 1
+                except queue.Empty:
+                    pass
+        self.loop.call_soon_threadsafe(self.frame_ready.set)
+
+    def mark_alive(self):
+        """
+        Record that the data source is reachable although it has sent no new frame,
+        so the last frame is still up to date. Can be called from any thread.
+
+        :return: None
+        """
+        self.alive_at = monotonic()
+        self.loop.call_soon_threadsafe(self.frame_ready.set)
+
+    def get_frames(self):
+        """
+        Take all frames produced since the last call without blocking.
+
+        :return: list of frames, oldest first
+        """
+        frames = []
+        while True:
+            try:
+                frames.append(self.frames.get_nowait())
+            except queue.Empty:
+                return frames
+
+
+class AcquisitionThread(threading.Thread):
+    """
+    Periodically reads frames from a data source (WLANBoxConnector or Emulator) in a dedicated thread.
+    """
+
+    def __init__(self, source, interval, frames) -> None:
+        super().__init__(name='acquisition', daemon=True)
+        self.source = source
+        self.interval = interval
+        self.frames = frames
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            started_at = monotonic()
+            try:
+                frame = self.source.get_frame()
+            except Exception as e:
+                # connectors handle expected ADS errors themselves, anything else must not end acquisition:
+                # the failure is reported as a failed read and polling goes on
+                print(f'Acquisition read failed: {e!r}')
+                self.source.connection.record_failure(repr(e))
+            else:
+                self.frames.put(frame)
+            elapsed = monotonic() - started_at
+            self._stop_event.wait(max(0.0, self.interval - elapsed))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class NotificationAcquisition(threading.Thread):
+    """
+    Receives frames pushed by a data source (WLANBoxConnector or Emulator) through device notifications.
+    The thread itself only supervises the subscription: it subscribes whenever the connection supervisor
+    allows an attempt and subscribes again after the connection has backed off.
+    On-change notifications are silent while data is steady, so after probe_seconds of silence
+    the source is probed instead: a successful probe keeps the last frame fresh, a failed one is a failed read.
+    Silence of cyclic notifications is a failed read by itself.
+
+    :param on_change: if True, frames are pushed only when data changes, otherwise every cycle
+    :param cycle_time: cycle time in seconds
+    :param probe_seconds: time without notifications or probes after which the source is checked
+    """
+
+    def __init__(self, source, frames, on_change=True, cycle_time=0.2, probe_seconds=0.5) -> None:
+        super().__init__(name='notifications', daemon=True)
+        self.source = source
+        self.frames = frames
+        self.on_change = on_change
+        self.cycle_time = cycle_time
+        self.probe_seconds = probe_seconds
+        self.subscribed = False
+        self.last_notification_at = None
+        self._stop_event = threading.Event()
+
+    def _on_frame(self, frame):
+        self.last_notification_at = monotonic()
+        self.source.connection.record_success()
+        self.frames.put(frame)
+
+    def run(self):
+        connection = self.source.connection
+        while True:
+            if not self.subscribed:
+                if connection.can_attempt():
+                    self.subscribed = self.source.subscribe(self._on_frame, self.on_change, self.cycle_time)
+                    self.last_notification_at = monotonic()
+            elif monotonic() - self.last_notification_at > self.probe_seconds:
+                if not self.on_change:
+                    connection.record_failure(f'No notifications for {self.probe_seconds} s')
+                elif self.source.probe():
+                    self.frames.mark_alive()
+                self.last_notification_at = monotonic()
+                if connection.state == ConnectionState.BACKING_OFF:
+                    # the source failed repeatedly, the subscription is set up again after the backoff delay
+                    self.source.unsubscribe()
+                    self.subscribed = False
+            if self._stop_event.wait(self.cycle_time):
+                break
+        if self.subscribed:
+            self.source.unsubscribe()
+            self.subscribed = False
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
@@ -0,0 +1,154 @@
+"""
+archive.py stores finished test sessions in a local SQLite database.
+Sessions are indexed by mould, start date and tester, so the reports page can page through them without full scans.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from reporter import build_report_data
+
+archive_page_size = 20
+
+schema = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    mould_id TEXT NOT NULL,
+    mould_name TEXT NOT NULL,
+    tester_name TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT NOT NULL,
+    tested INTEGER NOT NULL,
+    successful INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    report_data TEXT NOT NULL,
+    report_digest TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_by_start ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS sessions_by_mould ON sessions (mould_id, started_at);
+CREATE INDEX IF NOT EXISTS sessions_by_tester ON sessions (tester_name, started_at);
+CREATE TABLE IF NOT EXISTS test_results (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    label INTEGER NOT NULL,
+    mold_side TEXT NOT NULL,
+    result TEXT NOT NULL,
+    test TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS test_results_by_session ON test_results (session_id);
+'''
+
+
+class SessionArchive:
+    """
+    Archive of finished test sessions.
+    Every session row stores its summary, the config it was tested with and the data needed to render its report,
+    results of individual thermocouple tests are stored in test_results.
+    """
+
+    def __init__(self, path) -> None:
+        super().__init__()
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(schema)
+        self.lock = threading.Lock()
+
+    def save_session(self, station, test_session, config, report_data):
+        """
+        Store test session of a mould station.
+
+        :param station: MouldStation instance
+        :param test_session: finished TestSession of the station
+        :param config: MSDConfig the session was tested with
+        :param report_data: report data of the session, as passed to reporter.generate_report
+        :return: id of the archived session
+        """
+        test_results = test_session.test_results
+        counts = [test_results.get_side_counts(side.name) for side in station.mold_config.mold_sides]
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO sessions (mould_id, mould_name, tester_name, started_at, finished_at, '
+                'tested, successful, failed, config, report_data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (station.id, station.mold_config.name, config.tester_name,
+                 test_session.started_at.isoformat(), datetime.datetime.now().isoformat(),
+                 sum(count['tested'] for count in counts), sum(count['success'] for count in counts),
+                 sum(count['fail'] for count in counts), json.dumps(config.to_dict()), json.dumps(report_data)))
+            session_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO test_results (session_id, label, mold_side, result, test) VALUES (?, ?, ?, ?, ?)',
+                [(session_id, test.tc.label, test.tc.mold_side, test.result, json.dumps(test.to_dict(), default=float))
+                 for test in test_results])
+        return session_id
+
+    def list_sessions(self, mould_id=None, tester_name=None, date=None, page=1, page_size=archive_page_size):
+        """
+        List archived sessions, newest first.
+
+        :param mould_id: only sessions of this mould if set
+        :param tester_name: only sessions of this tester if set
+        :param date: datetime.date, only sessions started on this day if set
+        :param page: page number, starting from 1
+        :param page_size: number of sessions per page
+        :return: tuple of list of session summaries (dicts) and total number of matching sessions
+        """
+        conditions = []
+        params = []
+        if mould_id:
+            conditions.append('mould_id = ?')
+            params.append(mould_id)
+        if tester_name:
+            conditions.append('tester_name = ?')
+            params.append(tester_name)
+        if date:
+            # ISO strings of the same day share a prefix, so the range can use the started_at part of the indexes
+            conditions.append('started_at >= ? AND started_at < ?')
+            params += [date.isoformat(), (date + datetime.timedelta(days=1)).isoformat()]
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        with self.lock:
+            total = self.connection.execute(f'SELECT COUNT(*) FROM sessions {where}', params).fetchone()[0]
+            rows = self.connection.execute(
+                'SELECT id, mould_id, mould_name, tester_name, started_at, finished_at, tested, successful, failed '
+                f'FROM sessions {where} ORDER BY started_at DESC LIMIT ? OFFSET ?',
+                params + [page_size, (page - 1) * page_size]).fetchall()
+        return [dict(row) for row in rows], total
+
+    def get_session(self, session_id):
+        """
+        :param session_id: id of the archived session
+        :return: dict with all session columns and list of its test results or None if there is no such session
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM sessions WHERE id = ?', (session_id,)).fetchone()
+            if row is None:
+                return None
+            results = self.connection.execute(
+                'SELECT test FROM test_results WHERE session_id = ? ORDER BY rowid', (session_id,)).fetchall()
+        session = dict(row)
+        session['config'] = json.loads(session['config'])
+        session['report_data'] = json.loads(session['report_data'])
+        session['test_results'] = [json.loads(result['test']) for result in results]
+        return session
+
+    def set_report_digest(self, session_id, digest):
+        """Remember the rendered report of a session, so it is served from the report file next time."""
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE sessions SET report_digest = ? WHERE id = ?', (digest, session_id))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+async def close_archive(app):
+    """Archives unfinished test sessions with results, so they are not lost on restart."""
+    for station in app.stations.values():
+        if len(station.test_session.test_results):
+            app.archive.save_session(station, station.test_session, app.msd_config, build_report_data(station))
+    app.archive.close()
+
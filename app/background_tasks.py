@@ -2,48 +2,139 @@
 background_tasks.py describes tasks performed by application in the background.
 """
 import asyncio
+from time import monotonic, time
+
+import numpy as np
+
+from acquisition import AcquisitionThread, FrameQueue, NotificationAcquisition
 
 update_interval_seconds = 0.2
 update_task_name = 'box_listener'
+# 'polling' reads the process image every update interval,
+# 'notifications' subscribes to ADS device notifications instead
+acquisition_mode = 'polling'
+# used in 'notifications' mode: if True, frames are sent only when data changes, otherwise every cycle
+notify_on_change = True
+# frame is considered stale if no new frame arrived within this time
+stale_frame_seconds = 1.0
+# on-change notifications send nothing while data does not change,
+# the PLC is probed after this time without notifications, so the last frame is kept fresh while it answers
+notification_probe_seconds = 0.5
+# if True, keep serving the last good frame (marked as stale) while the PLC is slow,
+# otherwise report all mold sides as having no data
+serve_stale_frames = True
+no_data_state = 'No data from PLC'
 
 
 async def start_background_tasks(app):
-    """Starts periodic background update task for application."""
-    app[update_task_name] = asyncio.create_task(update_task(app))
+    """Starts acquisition and periodic background update task for every mould station of the application."""
+    loop = asyncio.get_running_loop()
+    app[update_task_name] = []
+    for station in app.stations.values():
+        frame_ready = asyncio.Event()
+        station.frames = FrameQueue(loop, frame_ready)
+        if acquisition_mode == 'notifications':
+            station.acquisition = NotificationAcquisition(
+                station.wlanbox, station.frames, notify_on_change, update_interval_seconds,
+                notification_probe_seconds if notify_on_change else stale_frame_seconds)
+        else:
+            station.acquisition = AcquisitionThread(station.wlanbox, update_interval_seconds, station.frames)
+        station.acquisition.start()
+        app[update_task_name].append(asyncio.create_task(update_task(app, station, frame_ready)))
 
 
 async def cleanup_background_tasks(app):
-    """Cancels periodic background update task."""
-    app[update_task_name].cancel()
-    await app[update_task_name]
+    """Cancels periodic background update tasks and stops acquisition."""
+    for task in app[update_task_name]:
+        task.cancel()
+    await asyncio.gather(*app[update_task_name], return_exceptions=True)
+    loop = asyncio.get_running_loop()
+    for station in app.stations.values():
+        await loop.run_in_executor(None, station.acquisition.stop)
+        station.wlanbox.close()
+        if station.disk_history:
+            station.disk_history.close()
+
+
+def process_frame(station, frame, config):
+    """
+    Updates mold sides connection statuses, thermocouple temperature and status values
+    and current test session of a mould station with a single frame.
+
+    :param station: MouldStation instance
+    :param frame: frame produced by acquisition
+    :param config: current application config
+    :return: None
+    """
+    # update mold sides
+    station.mold_side_states = frame['mold_side_states']
+
+    # update thermocouples
+    state = frame['state']
+    if state:
+        side_ok = np.array([station.mold_side_states[side.name] == 'No error'
+                            for side in station.mold_config.mold_sides])
+        temperatures = state['temperature'][station.tc_channels]
+        temperatures[~side_ok[station.tc_sides]] = np.nan
+        statuses = state['status'][station.tc_channels]
+        station.history.append(frame['time'], temperatures)
+        station.rollups.add_sample(frame['time'], temperatures)
+        if station.disk_history:
+            station.disk_history.append(frame['time'], temperatures)
+        # same rules as in Thermocouple.update: 0 is OK, 67 is disconnected, other statuses keep the last one
+        tc_active = np.where(statuses == 0, True, np.where(statuses == 67, False, station.tc_active))
+        changed = tc_active != station.tc_active
+        if changed.any():
+            station.test_session.statuses_changed({station.mold_config.mold_sides[side].name
+                                                   for side in station.tc_sides[changed].tolist()})
+        station.tc_active = tc_active
+        for tc, temperature, status in zip(station.tcs.values(), temperatures.tolist(), statuses.tolist()):
+            tc.update(None if np.isnan(temperature) else temperature, status)
 
+    # test session update
+    station.test_session.update(station.tc_list, station.history, station.tc_active, config)
 
-async def update_task(app):
+
+async def update_task(app, station, frame_ready):
     """
-    This method performs the periodic update for the application: it updates mold sides connection statuses,
-    retrieves data from wlanboxconnector to update thermocouple temperature and status values
-    and performs update on a current test session.
+    This method performs the update for a mould station: it waits for frames produced by acquisition
+    (mold sides connection statuses together with thermocouple data) and processes them in order.
+    If no frame arrives in time, the last frame is marked as stale.
+    When frames are only sent on change, the last frame is held and processed again every update interval.
+    After every tick, the update is pushed to live update clients.
 
     :param app: Application instance
+    :param station: MouldStation instance
+    :param frame_ready: asyncio.Event set by acquisition when a new frame is queued
     :return: None
     """
-    wlanbox = app.wlanbox
+    hold_last_frame = acquisition_mode == 'notifications' and notify_on_change
+    wait_timeout = update_interval_seconds if hold_last_frame else stale_frame_seconds
+    no_data_states = {side.name: no_data_state for side in station.mold_config.mold_sides}
+    station.mold_side_states = no_data_states
+    last_frame = None
     while True:
-        # update mold sides
-        app.mold_side_states = wlanbox.get_mould_side_states()
-
-        # update thermocouples
-        sensor_data = wlanbox.get_sensor_data()
-        state = sensor_data['state']
-        time = sensor_data['time']
-        if state:
-            for label in app.tcs.keys():
-                tc = app.tcs.get(label)
-                if app.mold_side_states[tc.mold_side] == 'No error':
-                    tc.update(state[label]['temperature'], state[label]['status'], time)
-                else:
-                    tc.update(None, state[label]['status'], time)
-
-        # test session update
-        app.test_session.update(app.tcs, app.msd_config)
-        await asyncio.sleep(update_interval_seconds)
+        try:
+            await asyncio.wait_for(frame_ready.wait(), wait_timeout)
+        except asyncio.TimeoutError:
+            pass
+        frame_ready.clear()
+
+        frames = station.frames.get_frames()
+        if not frames and hold_last_frame and last_frame:
+            # nothing changed since the last notification, acquired_at is kept,
+            # the frame is fresh as long as successful probes confirm it
+            frames = [dict(last_frame, time=time())]
+        for frame in frames:
+            process_frame(station, frame, app.msd_config)
+        if frames:
+            last_frame = frames[-1]
+        station.last_frame_at = station.frames.alive_at
+
+        station.frame_is_stale = (station.last_frame_at is None or
+                                  monotonic() - station.last_frame_at > stale_frame_seconds)
+        if station.frame_is_stale and not serve_stale_frames:
+            station.mold_side_states = no_data_states
+        station.state_changed()
+        if station.live_updates:
+            station.live_updates.publish()
@@ -1,3 +1,8 @@
 def get_breadcrumb_data(request):
-    breadcrumbs = [item.replace('-', ' ').title() for item in request.rel_url.parts if item != '/']
+    parts = [item for item in request.rel_url.parts if item != '/']
+    # mould scoped pages start with /moulds/{mould_id}
+    mould_id = request.match_info.get('mould_id')
+    if mould_id is not None:
+        parts = [f'Mold {mould_id}'] + parts[2:]
+    breadcrumbs = [item.replace('-', ' ').title() for item in parts]
     return breadcrumbs
@@ -14,7 +14,8 @@ class MSDConfig:
                  test_degrees=4,
                  tester_name="Mr. Tester",
                  min_graph_temperature=24,
-                 max_graph_temperature=38) -> None:
+                 max_graph_temperature=38,
+                 detection_method='streaming') -> None:
         super().__init__()
         self.detection_time = detection_time
         self.detection_degrees = detection_degrees
@@ -23,7 +24,22 @@ class MSDConfig:
         self.tester_name = tester_name
         self.min_graph_temperature = min_graph_temperature
         self.max_graph_temperature = max_graph_temperature
+        # 'streaming' - incremental sliding window minimum detector,
+        # 'window' - temperature rise over detection time checked on the whole history
+        self.detection_method = detection_method
 
+    def to_dict(self):
+        """Inverse of fromdict, times are in seconds."""
+        return {
+            'detection_time': self.detection_time.seconds,
+            'detection_degrees': self.detection_degrees,
+            'test_time': self.test_time.seconds,
+            'test_degrees': self.test_degrees,
+            'tester_name': self.tester_name,
+            'min_graph_temperature': self.min_graph_temperature,
+            'max_graph_temperature': self.max_graph_temperature,
+            'detection_method': self.detection_method,
+        }
 
     @classmethod
     def fromdict(cls, d):
@@ -35,6 +51,7 @@ class MSDConfig:
             d['tester_name'],
             int(d['min_graph_temperature']),
             int(d['max_graph_temperature']),
+            d.get('detection_method', 'streaming'),
         ]
         result = cls(*params)
         return result
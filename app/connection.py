@@ -0,0 +1,101 @@
+"""
+connection.py tracks the state of the connection to the WLAN box and decides when to retry after failures.
+"""
+import random
+from enum import Enum
+from time import monotonic
+
+
+class ConnectionState(Enum):
+    CONNECTED = 'connected'
+    # reads failed recently, but they are still retried every tick
+    DEGRADED = 'degraded'
+    # too many failed reads in a row, reads are retried with exponential backoff
+    BACKING_OFF = 'backing off'
+
+
+class ConnectionSupervisor:
+    """
+    Connection state machine with exponential backoff and jitter.
+    After failures_before_backoff failed reads in a row the connection goes from DEGRADED to BACKING_OFF,
+    and every next failed retry doubles the delay up to max_delay.
+    The first successful read brings the connection back to CONNECTED and resets the delay.
+    """
+
+    def __init__(self,
+                 failures_before_backoff=3,
+                 initial_delay=0.5,
+                 max_delay=5.0,
+                 multiplier=2,
+                 jitter=0.5) -> None:
+        super().__init__()
+        self.failures_before_backoff = failures_before_backoff
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+        self.state = ConnectionState.CONNECTED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.reconnects = 0
+        self.last_error = None
+        self.retry_at = None
+
+    def can_attempt(self):
+        """
+        Check if a read should be attempted now.
+
+        :return: False while waiting for the backoff delay to pass, True otherwise
+        """
+        return self.state != ConnectionState.BACKING_OFF or monotonic() >= self.retry_at
+
+    def record_success(self):
+        if self.state != ConnectionState.CONNECTED:
+            self.reconnects += 1
+            print(f'Connection to the WLAN box restored after {self.consecutive_failures} failed attempts.')
+        self.state = ConnectionState.CONNECTED
+        self.consecutive_failures = 0
+        self.retry_at = None
+
+    def record_failure(self, error):
+        """
+        Register a failed read and move to the next state.
+
+        :param error: error message
+        :return: None
+        """
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.last_error = error
+        if self.consecutive_failures < self.failures_before_backoff:
+            if self.state == ConnectionState.CONNECTED:
+                print("Looks like you're disconnected. :(\nPlease, run TwinCAT. Error msg: ", error)
+            self.state = ConnectionState.DEGRADED
+            return
+        if self.state != ConnectionState.BACKING_OFF:
+            print('WLAN box unreachable, backing off.')
+        self.state = ConnectionState.BACKING_OFF
+        self.retry_at = monotonic() + self.get_delay()
+
+    def get_delay(self):
+        """
+        Get delay before the next retry.
+
+        :return: exponentially growing delay in seconds with random jitter applied
+        """
+        # exponent is capped, so that long outages do not overflow
+        retries = min(self.consecutive_failures - self.failures_before_backoff, 32)
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** retries)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def to_dict(self):
+        retry_in = max(0.0, self.retry_at - monotonic()) if self.retry_at else None
+        return {
+            'state': self.state.value,
+            'consecutive_failures': self.consecutive_failures,
+            'total_failures': self.total_failures,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+            'retry_in': retry_in,
+        }
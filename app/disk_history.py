@@ -0,0 +1,188 @@
+"""
+disk_history.py stores long-term temperature history of a mould on disk.
+Records of fixed size are appended to segment files which are accessed through memory maps,
+so neither writing nor range queries keep the history in process memory.
+"""
+import datetime
+import os
+
+import numpy as np
+
+
+class DiskHistoryStore:
+    """
+    Append-only time series store with one record (time + temperatures of all thermocouples) per tick.
+    Records are written into preallocated segment files of segment_records records each.
+    When a segment is full, a new one is started and the oldest segments exceeding max_segments are removed.
+
+    Segment files are named after the sequence number of their first record.
+    Segments of a different record layout are renamed to *.seg.incompatible and left alone.
+    Unused records of a preallocated segment have time 0, which is used to find the end of data after restart.
+    """
+
+    def __init__(self, directory, tc_count, segment_records=18000, max_segments=24) -> None:
+        super().__init__()
+        self.directory = directory
+        self.tc_count = tc_count
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.record_dtype = np.dtype([
+            ('time', '<f8'),
+            ('temperatures', '<f4', (tc_count,)),
+        ])
+        os.makedirs(directory, exist_ok=True)
+        # list of [first sequence number, memory map] ordered by sequence number
+        self.segments = []
+        # number of records written into the last segment
+        self.position = 0
+        self._open_segments()
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f'{first_seq:012d}.seg')
+
+    def _open_segments(self):
+        segment_size = self.record_dtype.itemsize * self.segment_records
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.seg'):
+                continue
+            path = os.path.join(self.directory, filename)
+            if os.path.getsize(path) != segment_size:
+                self._move_aside(path)
+                continue
+            records = np.memmap(path, dtype=self.record_dtype, mode='r+', shape=(self.segment_records,))
+            self.segments.append([int(filename[:-len('.seg')]), records])
+        if self.segments:
+            self.position = int(np.count_nonzero(self.segments[-1][1]['time']))
+            self._remove_old_segments()
+        else:
+            self._add_segment(0)
+
+    def _move_aside(self, path):
+        """
+        Rename a segment written with a different record layout (e.g. the number of thermocouples has changed),
+        so it is neither overwritten by new segments nor opened again. Moved segments are kept for manual recovery.
+        """
+        number = 0
+        while True:
+            new_path = f'{path}.incompatible{number or ""}'
+            if not os.path.exists(new_path):
+                break
+            number += 1
+        os.rename(path, new_path)
+        print(f'Incompatible history segment {path} moved to {new_path}.')
+
+    def _add_segment(self, first_seq):
+        path = self._segment_path(first_seq)
+        records = np.memmap(path, dtype=self.record_dtype, mode='w+', shape=(self.segment_records,))
+        self.segments.append([first_seq, records])
+        self.position = 0
+        self._remove_old_segments()
+
+    def _remove_old_segments(self):
+        while len(self.segments) > self.max_segments:
+            old_seq, old_records = self.segments.pop(0)
+            del old_records
+            try:
+                os.remove(self._segment_path(old_seq))
+            except OSError as e:
+                # e.g. the file is still mapped on Windows, it is removed after restart
+                print(f'Failed to remove history segment {old_seq}: {e}')
+
+    @property
+    def count(self):
+        """Total number of records ever written."""
+        return self.segments[-1][0] + self.position
+
+    @property
+    def oldest_time(self):
+        """Time of the oldest record or None if the store is empty."""
+        first_records = self.segments[0][1]
+        if len(self.segments) == 1 and not self.position:
+            return None
+        return float(first_records['time'][0])
+
+    def append(self, time, temperatures):
+        """
+        Append one record of all thermocouples.
+
+        :param time: POSIX timestamp of the record
+        :param temperatures: array of temperatures in thermocouple order, NaN if unknown
+        :return: None
+        """
+        if self.position == self.segment_records:
+            self.segments[-1][1].flush()
+            self._add_segment(self.count)
+        records = self.segments[-1][1]
+        records['time'][self.position] = time
+        records['temperatures'][self.position] = temperatures
+        self.position += 1
+
+    def read_range(self, time_from=None, time_to=None, index=None):
+        """
+        Read records between two moments straight from the mapped segments.
+
+        :param time_from: POSIX timestamp, start of the range (inclusive), from the oldest record if None
+        :param time_to: POSIX timestamp, end of the range (inclusive), up to the newest record if None
+        :param index: thermocouple row index, all thermocouples are returned if None
+        :return: tuple of times array and temperatures array ([n] for a single thermocouple, [tc_count, n] otherwise)
+        """
+        chunks = list(self.iter_range(time_from, time_to, index))
+        if not chunks:
+            shape = (0,) if index is not None else (self.tc_count, 0)
+            return np.empty(0), np.empty(shape, dtype=np.float32)
+        times, temperatures = zip(*chunks)
+        return np.concatenate(times), np.concatenate(temperatures, axis=-1)
+
+    def iter_range(self, time_from=None, time_to=None, index=None, chunk_records=None):
+        """
+        Iterate over records between two moments in chunks, so a long range is never read into memory at once.
+        Chunks are views of the mapped segments and are only valid until the segment is removed,
+        records appended after the iteration has started are not included.
+
+        :param time_from: POSIX timestamp, start of the range (inclusive), from the oldest record if None
+        :param time_to: POSIX timestamp, end of the range (inclusive), up to the newest record if None
+        :param index: thermocouple row index or list of indices, all thermocouples if None
+        :param chunk_records: maximum number of records per chunk, whole segments if None
+        :return: generator of tuples of times array and temperatures array
+                 ([n] for a single thermocouple index, [number of thermocouples, n] otherwise)
+        """
+        segments = list(self.segments)
+        position = self.position
+        for segment_index, (first_seq, records) in enumerate(segments):
+            length = position if segment_index == len(segments) - 1 else self.segment_records
+            segment_times = records['time'][:length]
+            if not length:
+                continue
+            if time_from is not None and segment_times[-1] < time_from:
+                continue
+            if time_to is not None and segment_times[0] > time_to:
+                break
+            start = 0 if time_from is None else int(np.searchsorted(segment_times, time_from, side='left'))
+            end = length if time_to is None else int(np.searchsorted(segment_times, time_to, side='right'))
+            step = chunk_records or max(end - start, 1)
+            for chunk_start in range(start, end, step):
+                chunk_end = min(chunk_start + step, end)
+                chunk_temperatures = records['temperatures'][chunk_start:chunk_end]
+                if index is not None:
+                    chunk_temperatures = chunk_temperatures[:, index]
+                yield segment_times[chunk_start:chunk_end], chunk_temperatures.T
+
+    def close(self):
+        for _, records in self.segments:
+            records.flush()
+        self.segments = []
+
+
+def parse_time(value):
+    """
+    Parse time passed in a query.
+
+    :param value: POSIX timestamp or ISO format local time string, or None
+    :return: POSIX timestamp or None
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,37 @@
+"""
+downsampling.py reduces time series to a bounded number of points before they are sent to the client.
+"""
+import numpy as np
+
+
+def minmax_downsample(times, values, max_points):
+    """
+    Min/max decimation: the series is split into max_points // 2 buckets of equal sample count
+    and only the minimum and the maximum of every bucket are kept, in time order.
+    Unlike averaging or picking every n-th sample, heating peaks are always preserved.
+
+    :param times: array of sample times
+    :param values: array of values, NaN if unknown
+    :param max_points: maximum number of points in the result
+    :return: tuple of times and values arrays with at most max_points elements
+    """
+    length = len(values)
+    if length <= max_points:
+        return times, values
+    bucket_count = max(max_points // 2, 1)
+    bucket_size = -(-length // bucket_count)
+    padded = np.full(bucket_count * bucket_size, np.nan)
+    padded[:length] = values
+    buckets = padded.reshape(bucket_count, bucket_size)
+    unknown = np.isnan(buckets)
+    min_columns = np.where(unknown, np.inf, buckets).argmin(axis=1)
+    max_columns = np.where(unknown, -np.inf, buckets).argmax(axis=1)
+
+    offsets = np.arange(bucket_count) * bucket_size
+    indices = np.sort(np.stack([min_columns, max_columns], axis=1), axis=1) + offsets[:, np.newaxis]
+    indices = np.minimum(indices.ravel(), length - 1)
+    # drop the second point of buckets where minimum and maximum are the same sample
+    keep = np.ones(len(indices), dtype=bool)
+    keep[1:] = indices[1:] != indices[:-1]
+    indices = indices[keep]
+    return np.asarray(times)[indices], np.asarray(values)[indices]
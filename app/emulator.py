@@ -1,5 +1,10 @@
+import threading
 from datetime import datetime
 
+import numpy as np
+
+from connection import ConnectionSupervisor
+
 
 class TCEmu:
     def __init__(self, label, status=0) -> None:
@@ -39,6 +44,42 @@ class Heating:
         return self.time > self.total_seconds
 
 
+class NotificationEmulator(threading.Thread):
+    """
+    Local stand-in for ADS device notifications.
+    Pushes frames generated by the Emulator to the callback either every cycle or only when data changes.
+    """
+
+    def __init__(self, emulator, callback, on_change, cycle_time) -> None:
+        super().__init__(name='notification-emulator', daemon=True)
+        self.emulator = emulator
+        self.callback = callback
+        self.on_change = on_change
+        self.cycle_time = cycle_time
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _frames_equal(frame, other):
+        if frame['mold_side_states'] != other['mold_side_states']:
+            return False
+        state, other_state = frame['state'], other['state']
+        return (np.array_equal(state['status'], other_state['status']) and
+                np.array_equal(state['temperature'], other_state['temperature'], equal_nan=True))
+
+    def run(self):
+        last_frame = None
+        while not self._stop_event.wait(self.cycle_time):
+            frame = self.emulator.get_frame()
+            if self.on_change and last_frame and self._frames_equal(frame, last_frame):
+                continue
+            last_frame = frame
+            self.callback(frame)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
 class Emulator:
 
     def __init__(self, thermocouple_count) -> None:
@@ -62,6 +103,8 @@ class Emulator:
         self.heatings = {}
         self.heating_emulation = heating_modes['no_heating']
         self.slave_statuses = slave_status_modes['ok']
+        # emulated connection never fails
+        self.connection = ConnectionSupervisor()
 
     def _get_successful_process_dummy(self):
         tc_step = 2
@@ -150,13 +193,14 @@ class Emulator:
     def get_sensor_data(self):
         self._update_fake_data()
 
+        status = np.fromiter((tc.status for tc in self.tcs), dtype='u1', count=self.thermocouple_count)
+        temperature = np.fromiter((tc.temperature for tc in self.tcs), dtype=float, count=self.thermocouple_count)
+        temperature[status != 0] = np.nan
         state = {
-            tc.label: {
-                'status': tc.status,
-                'temperature': tc.temperature if tc.status == 0 else None,
-            } for tc in self.tcs
+            'status': status,
+            'temperature': temperature,
         }
-        current_time = datetime.now().isoformat()
+        current_time = datetime.now().timestamp()
         result = {'time': current_time,
                   'state': state}
         return result
@@ -177,3 +221,36 @@ class Emulator:
 
     def get_mould_side_states(self):
         return self.slave_statuses
+
+    def get_frame(self):
+        frame = self.get_sensor_data()
+        frame['mold_side_states'] = self.get_mould_side_states()
+        return frame
+
+    def subscribe(self, callback, on_change=True, cycle_time=0.2):
+        """
+        Emulate subscription to ADS device notifications, see WLANBoxConnector.subscribe.
+
+        :param callback: called with a new frame from the notification thread
+        :param on_change: if True, notify only when data changes, otherwise every cycle
+        :param cycle_time: cycle time in seconds
+        :return: True, emulated subscription never fails
+        """
+        self.notifier = NotificationEmulator(self, callback, on_change, cycle_time)
+        self.notifier.start()
+        return True
+
+    def unsubscribe(self):
+        self.notifier.stop()
+
+    def probe(self):
+        """
+        Emulate the PLC state check, see WLANBoxConnector.probe.
+
+        :return: True, emulated PLC is always reachable
+        """
+        self.connection.record_success()
+        return True
+
+    def close(self):
+        pass
@@ -0,0 +1,111 @@
+"""
+exports.py streams raw thermocouple history and test results for analysis outside the application.
+Exports are produced chunk by chunk by generators and sent with chunked transfer encoding,
+so a large export is never built in memory and chunks are formatted outside the event loop.
+
+History is exported as CSV or in a binary columnar format:
+    header: magic b'MSDH', uint16 format version, uint32 thermocouple count, int32 label per thermocouple
+    blocks: uint32 record count n, float64 times[n], float32 temperatures[n] of every thermocouple in turn
+    end: block with n = 0
+All numbers are little-endian, times are POSIX timestamps and unknown temperatures are NaN.
+"""
+import asyncio
+import csv
+import io
+import struct
+
+import numpy as np
+from aiohttp import web
+
+from history import to_isoformat
+
+# records formatted at once, a chunk of CSV is a few hundred kilobytes for 40 thermocouples
+export_chunk_records = 3600
+
+history_format_version = 1
+history_header = struct.Struct('<4sHI')
+history_block_header = struct.Struct('<I')
+
+test_columns = ('label', 'text_label', 'mold_side', 'x', 'y', 'result', 'is_complete',
+                'init_time', 'start_time', 'start_temperature', 'status', 'temperature')
+
+
+def history_csv_chunks(chunks, tcs):
+    """
+    Format history chunks as CSV with a time column and a column per thermocouple.
+
+    :param chunks: iterable of times array and temperatures array [number of thermocouples, n]
+    :param tcs: exported thermocouples in column order
+    :return: generator of encoded CSV chunks
+    """
+    yield ','.join(['time'] + [tc.text_label for tc in tcs]).encode() + b'\r\n'
+    for times, temperatures in chunks:
+        # NaN is formatted as 'nan' and replaced by an empty field
+        values = np.char.mod('%.2f', temperatures.T.astype(np.float64))
+        values[np.isnan(temperatures.T)] = ''
+        lines = [','.join([time] + row) for time, row in zip(to_isoformat(times), values.tolist())]
+        yield ('\r\n'.join(lines) + '\r\n').encode()
+
+
+def history_binary_chunks(chunks, tcs):
+    """
+    Encode history chunks in the binary columnar format described in the module docstring.
+
+    :param chunks: iterable of times array and temperatures array [number of thermocouples, n]
+    :param tcs: exported thermocouples in column order
+    :return: generator of encoded blocks
+    """
+    yield (history_header.pack(b'MSDH', history_format_version, len(tcs))
+           + np.array([tc.label for tc in tcs], dtype='<i4').tobytes())
+    for times, temperatures in chunks:
+        yield (history_block_header.pack(len(times)) + np.asarray(times, dtype='<f8').tobytes()
+               + np.ascontiguousarray(temperatures, dtype='<f4').tobytes())
+    yield history_block_header.pack(0)
+
+
+def tests_csv_chunks(tests, chunk_rows=500):
+    """
+    Format thermocouple test results as CSV.
+
+    :param tests: iterable of dicts as returned by TcTest.to_dict
+    :param chunk_rows: number of rows per chunk
+    :return: generator of encoded CSV chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, test_columns, extrasaction='ignore')
+    writer.writeheader()
+    for row_number, test in enumerate(tests, 1):
+        writer.writerow(test)
+        if row_number % chunk_rows == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+async def stream_export(request, chunks, content_type, filename):
+    """
+    Send export chunks as they are produced.
+    Every chunk is produced in the default executor, writing waits until the client has received enough data,
+    so neither formatting nor a slow client holds up the acquisition loop.
+
+    :param request: request instance
+    :param chunks: generator of bytes
+    :param content_type: content type of the export
+    :param filename: file name offered to the client
+    :return: response
+    """
+    response = web.StreamResponse(headers={
+        'Content-Type': content_type,
+        'Content-Disposition': f'attachment; filename="{filename}"',
+    })
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+        if chunk is None:
+            break
+        await response.write(chunk)
+    await response.write_eof()
+    return response
@@ -0,0 +1,149 @@
+"""
+history.py stores temperature history of all thermocouples of a mould in preallocated NumPy arrays.
+"""
+import datetime
+
+import numpy as np
+
+history_size = 500
+
+
+class HistoryStore:
+    """
+    Columnar ring buffer with temperature history of all thermocouples of a mould.
+    Temperatures are stored in a [tc_count, capacity] float32 matrix (NaN if temperature is unknown),
+    sample times in a float64 column of POSIX timestamps. One sample of all thermocouples is written per tick.
+
+    Every sample is written twice, at position i and i + capacity, so the samples currently in the buffer
+    always form a contiguous slice and can be returned as views without copying.
+    """
+
+    def __init__(self, tc_count, capacity=history_size) -> None:
+        super().__init__()
+        self.tc_count = tc_count
+        self.capacity = capacity
+        self._temperatures = np.full((tc_count, 2 * capacity), np.nan, dtype=np.float32)
+        self._times = np.zeros(2 * capacity, dtype=np.float64)
+        # total number of samples ever appended
+        self.count = 0
+        # (count, threshold in seconds, bound index) of the last threshold lookup
+        self._threshold_cache = None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, time, temperatures):
+        """
+        Append one sample of all thermocouples.
+
+        :param time: POSIX timestamp of the sample
+        :param temperatures: array of temperatures in thermocouple order, NaN if unknown
+        :return: None
+        """
+        position = self.count % self.capacity
+        mirror = position + self.capacity
+        self._temperatures[:, position] = temperatures
+        self._temperatures[:, mirror] = temperatures
+        self._times[position] = time
+        self._times[mirror] = time
+        self.count += 1
+
+    @property
+    def _window(self):
+        start = self.count % self.capacity if self.count >= self.capacity else 0
+        return slice(start, start + len(self))
+
+    @property
+    def times(self):
+        """View of sample times, oldest first."""
+        return self._times[self._window]
+
+    @property
+    def temperatures(self):
+        """View of the [tc_count, len] temperature matrix, oldest sample first."""
+        return self._temperatures[:, self._window]
+
+    def find_cursor_index(self, cursor):
+        """
+        Find where samples appended after a cursor start. Cursor is the value of count at the time of a previous read.
+
+        :param cursor: sample count returned to the client by a previous read
+        :return: index in the current window or None if the cursor is invalid or has fallen out of the buffer
+        """
+        if cursor < 0 or cursor > self.count or self.count - cursor > len(self):
+            return None
+        return len(self) - (self.count - cursor)
+
+    def find_threshold_index(self, time_threshold):
+        """
+        Find the index of the newest sample that is older than the last sample by more than time_threshold.
+        Sample times are kept as a monotonic float array, so the lookup is a binary search.
+        All thermocouples are sampled together, so the result is computed once per appended sample
+        and shared by all of them.
+
+        :param time_threshold: timedelta
+        :return: bound index in the current window or None if the history is too short for such index
+        """
+        threshold_seconds = time_threshold.total_seconds()
+        cache = self._threshold_cache
+        if cache and cache[0] == self.count and cache[1] == threshold_seconds:
+            return cache[2]
+
+        times = self.times
+        bound_index = None
+        if len(times):
+            current_time = times[-1]
+            index = int(np.searchsorted(times, current_time - threshold_seconds)) - 1
+            if index >= 0 and current_time - times[index] > threshold_seconds:
+                bound_index = index
+        self._threshold_cache = (self.count, threshold_seconds, bound_index)
+        return bound_index
+
+    def get_tc_history(self, index):
+        return ThermocoupleHistory(self, index)
+
+
+class ThermocoupleHistory:
+    """
+    Temperature history of a single thermocouple, a view into a row of HistoryStore.
+    """
+
+    def __init__(self, store, index) -> None:
+        super().__init__()
+        self.store = store
+        self.index = index
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def times(self):
+        return self.store.times
+
+    @property
+    def temperatures(self):
+        return self.store.temperatures[self.index]
+
+
+def to_isoformat(times):
+    """
+    Convert POSIX timestamps to local time ISO format strings.
+
+    :param times: array of POSIX timestamps
+    :return: list of strings
+    """
+    utc_offset = datetime.datetime.now().astimezone().utcoffset()
+    local_times = (np.asarray(times) * 1e6).astype('datetime64[us]') + np.timedelta64(utc_offset)
+    return np.datetime_as_string(local_times).tolist()
+
+
+def to_json_list(values, decimals=2):
+    """
+    Convert array of temperatures to a list that can be serialized to JSON.
+
+    :param values: array of temperatures, NaN if unknown
+    :param decimals: number of decimals to round to, removes float32 representation noise
+    :return: list of floats with None in place of NaN
+    """
+    values = np.asarray(values, dtype=np.float64).round(decimals)
+    return [None if value != value else value for value in values.tolist()]
@@ -0,0 +1,170 @@
+"""
+live_updates.py pushes heatmap, test session and thermocouple graph updates to test pages over WebSockets,
+so open operator screens do not have to poll three endpoints every update interval.
+"""
+import asyncio
+import json
+
+from aiohttp import web, WSMsgType
+
+from station import get_station
+from responses import dumps
+from snapshots import get_side_snapshot
+from views import build_tc_data, read_tc_window
+
+live_updates_key = 'live_update_sockets'
+
+
+class LiveClient:
+    """
+    A connected test page subscribed to a mold side and a thermocouple.
+    Updates are handed to the client through a single slot holding the latest update only:
+    if the client is slower than the acquisition, older updates it has not received yet are dropped.
+    Graph samples are sent incrementally after the cursor of the last sent update,
+    so dropped updates do not lose samples.
+    """
+
+    def __init__(self, ws, hub) -> None:
+        super().__init__()
+        self.ws = ws
+        self.hub = hub
+        self.mold_side = None
+        self.tc = None
+        # history cursor of the last sent graph data, None to send the whole window
+        self.cursor = None
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.dropped_updates = 0
+
+    @property
+    def subscription(self):
+        return (self.mold_side, self.tc) if self.mold_side is not None else None
+
+    def subscribe(self, mold_side, tc):
+        if tc != self.tc:
+            self.cursor = None
+        self.mold_side, self.tc = mold_side, tc
+
+    def offer(self, update):
+        """
+        Put update into the slot, replacing the one the client has not received yet.
+
+        :param update: tuple of binary heatmap frame and session info JSON text, as built by LiveUpdateHub.build_update
+        :return: None
+        """
+        if self.pending is not None:
+            self.dropped_updates += 1
+        self.pending = update
+        self.ready.set()
+
+    async def send_updates(self):
+        """Sends updates from the slot until the connection is closed."""
+        while not self.ws.closed:
+            await self.ready.wait()
+            self.ready.clear()
+            (frame, session), self.pending = self.pending, None
+            tc_text, self.cursor = self.hub.build_tc_update(self.tc, self.cursor)
+            try:
+                await self.ws.send_bytes(frame)
+                await self.ws.send_str('{"session": %s, "tc": %s}' % (session, tc_text))
+            except ConnectionError:
+                break
+
+
+class LiveUpdateHub:
+    """
+    Live update clients of a mould station.
+    Every update is built and serialized once per subscription and shared by all clients with that subscription,
+    graph data once per thermocouple and cursor.
+    """
+
+    def __init__(self, station) -> None:
+        super().__init__()
+        self.station = station
+        self.clients = set()
+        # (thermocouple label, cursor, history count) and serialized graph update with its new cursor
+        self.tc_updates = {}
+
+    def build_update(self, mold_side):
+        """
+        Build update of a mould side: binary heatmap frame and session info JSON text.
+        Both reuse the snapshots already serialized for the polling endpoints.
+        """
+        snapshot = get_side_snapshot(self.station, mold_side)
+        return snapshot.frame.body, snapshot.session.text
+
+    def build_tc_update(self, tc, cursor):
+        """
+        Serialize graph data of a thermocouple: the whole window if cursor is None,
+        otherwise samples after the cursor, in the same format as /tc-data?since=.
+
+        :param tc: thermocouple label
+        :param cursor: history cursor of the last update sent to the client or None
+        :return: tuple of JSON text and the new cursor
+        """
+        key = (tc, cursor, self.station.history.count)
+        if key not in self.tc_updates:
+            thermocouple = self.station.tcs[tc]
+            times, temperatures, extra = read_tc_window(thermocouple, cursor)
+            self.tc_updates[key] = (dumps(build_tc_data(thermocouple, times, temperatures, extra)).decode(),
+                                    extra['cursor'])
+        return self.tc_updates[key]
+
+    def publish(self):
+        """Pushes one combined update to every subscribed client. Called once per processed tick."""
+        # graph updates of the previous tick are outdated
+        self.tc_updates.clear()
+        updates = {}
+        for client in self.clients:
+            if client.subscription is None:
+                continue
+            if client.mold_side not in updates:
+                updates[client.mold_side] = self.build_update(client.mold_side)
+            client.offer(updates[client.mold_side])
+
+
+async def get_live_updates(request):
+    """
+    WebSocket endpoint of the test page. The client sends {"mold_side": ..., "tc": ...} to subscribe
+    (and again whenever the selected thermocouple changes) and receives for every tick
+    a binary heatmap frame (same as /heatmap-frame) and a {"session": ..., "tc": ...} object
+    with the same content as the polling endpoints. "tc" holds the whole graph window after subscribing
+    and only new samples afterwards, like /tc-data?since=.
+    """
+    station = get_station(request)
+    hub = station.live_updates
+    ws = web.WebSocketResponse(heartbeat=10)
+    await ws.prepare(request)
+    request.app[live_updates_key].add(ws)
+    client = LiveClient(ws, hub)
+    hub.clients.add(client)
+    sender = asyncio.create_task(client.send_updates())
+    mold_sides = [side.name for side in station.mold_config.mold_sides]
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                subscription = json.loads(msg.data)
+                mold_side = subscription['mold_side']
+                tc = int(subscription['tc'])
+            except (ValueError, KeyError, TypeError):
+                await ws.send_str(json.dumps({'msg': 'Expected {"mold_side": ..., "tc": ...}.'}))
+                continue
+            if mold_side not in mold_sides or tc not in station.tcs:
+                await ws.send_str(json.dumps({'msg': f'Unknown mold side {mold_side} or thermocouple {tc}.'}))
+                continue
+            client.subscribe(mold_side, tc)
+            # do not make the client wait for the next tick
+            client.offer(hub.build_update(mold_side))
+    finally:
+        hub.clients.discard(client)
+        request.app[live_updates_key].discard(ws)
+        sender.cancel()
+    return ws
+
+
+async def close_live_updates(app):
+    """Closes open WebSockets on shutdown, otherwise the server waits for the clients to disconnect."""
+    for ws in list(app[live_updates_key]):
+        await ws.close(code=1001, message=b'Server shutdown')
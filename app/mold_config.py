@@ -1,6 +1,11 @@
 """
 mold_config.py defines classes and methods for creating thermocouple array on application initialization
 """
+import hashlib
+import json
+
+import numpy as np
+
 from thermocouple import Thermocouple
 from pyCommonlySharedCode.MouldDimensions import get_mould_dimensions
 from pyCommonlySharedCode.generalFunctions import get_plantdatadir_and_plantconfig
@@ -42,10 +47,11 @@ class MouldConfig:
         self.mold_no = mold_no
 
     @classmethod
-    def from_common_config(cls):
+    def from_common_config(cls, mould_config=None):
         """
         This method uses pyCommonlySharedCode submodule for reading mould info.
 
+        :param mould_config: name of the plant mould configuration, the one from the common config is used if None
         :return: an instance of MouldConfig class
         """
         def get_list(ndarr):
@@ -64,7 +70,8 @@ class MouldConfig:
                 mould_sides.append(mold_side)
             return mould_sides
 
-        mould_dims = get_mould_dimensions(*get_plantdatadir_and_plantconfig())
+        plant_data_db_dir, default_mould_config = get_plantdatadir_and_plantconfig()
+        mould_dims = get_mould_dimensions(plant_data_db_dir, mould_config or default_mould_config)
         tc_count = mould_dims.Mould.TotalSensorCnt
         mould_sides = get_mould_sides(mould_dims)
         mold_no = str(int(mould_dims.Mould.ID))
@@ -87,3 +94,36 @@ def tcs_from_config(mold_config):
         }
         tcs.update(mold_side_tcs)
     return tcs
+
+
+def get_channel_indices(tcs):
+    """
+    Method for mapping thermocouples to their channels in acquired frames.
+
+    :param tcs: dictionary with TC labels as keys and thermocouple objects as values
+    :return: numpy array with frame index of each thermocouple, in tcs order
+    """
+    return np.array([label - 1 for label in tcs.keys()], dtype=np.intp)
+
+
+def get_side_indices(tcs, mold_sides):
+    """
+    Method for mapping thermocouples to the mould sides they are placed on.
+
+    :param tcs: dictionary with TC labels as keys and thermocouple objects as values
+    :param mold_sides: list of MouldSide instances
+    :return: numpy array with index of mould side of each thermocouple, in tcs order
+    """
+    side_names = [side.name for side in mold_sides]
+    return np.array([side_names.index(tc.mold_side) for tc in tcs.values()], dtype=np.intp)
+
+
+def get_config_version(mold_config):
+    """
+    Method for versioning data derived from the mould configuration, such as thermocouple geometry.
+
+    :param mold_config: MouldConfig instance
+    :return: 8 bytes digest that changes whenever the mould configuration changes
+    """
+    config = [mold_config.name, mold_config.tc_count, [side.to_dict() for side in mold_config.mold_sides]]
+    return hashlib.blake2b(json.dumps(config).encode(), digest_size=8).digest()
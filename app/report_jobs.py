@@ -0,0 +1,147 @@
+"""
+report_jobs.py renders PDF reports in worker processes, so report generation never blocks the event loop.
+Rendered reports are stored as content-addressed files and downloaded by job id.
+"""
+import asyncio
+import datetime
+import hashlib
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from reporter import generate_report
+
+reports_directory = os.path.join('data', 'reports')
+report_workers = 1
+# finished jobs kept for status queries and downloads, older jobs are forgotten (their files stay)
+max_finished_jobs = 100
+
+
+class ReportJob:
+    """
+    A single report rendering request.
+    Status is one of 'pending', 'done' and 'failed'.
+    """
+
+    def __init__(self, mould_id, filename) -> None:
+        super().__init__()
+        self.id = uuid.uuid4().hex
+        self.mould_id = mould_id
+        self.filename = filename
+        self.created_at = datetime.datetime.now()
+        self.status = 'pending'
+        self.error = None
+        # sha256 of the rendered document, also the name of its file
+        self.digest = None
+        self.size = None
+        self.task = None
+
+    @property
+    def path(self):
+        return report_path(self.digest) if self.digest else None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mould': self.mould_id,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'error': self.error,
+            'size': self.size,
+        }
+
+
+class ReportJobs:
+    """
+    Queue of report jobs executed by a process pool.
+    The pool is started with the first job.
+    """
+
+    def __init__(self, workers=report_workers) -> None:
+        super().__init__()
+        self.workers = workers
+        self.pool = None
+        # job id and ReportJob, oldest first
+        self.jobs = {}
+
+    def submit(self, mould_id, filename, *report_args):
+        """
+        Start rendering a report.
+
+        :param mould_id: id of the mould the report is about
+        :param filename: file name offered to the client on download
+        :param report_args: arguments of reporter.generate_report
+        :return: ReportJob instance
+        """
+        if self.pool is None:
+            # spawned workers start clean on every platform: a forked worker would inherit acquisition threads
+            # and open memory maps of the server process
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        job = ReportJob(mould_id, filename)
+        job.task = asyncio.create_task(self._render(job, report_args))
+        self.jobs[job.id] = job
+        self._forget_old_jobs()
+        return job
+
+    async def _render(self, job, report_args):
+        loop = asyncio.get_running_loop()
+        try:
+            document = await loop.run_in_executor(self.pool, generate_report, *report_args)
+            job.digest = hashlib.sha256(document).hexdigest()
+            job.size = len(document)
+            await loop.run_in_executor(None, store_document, job.path, document)
+            job.status = 'done'
+        except Exception as e:
+            print(f'Report {job.id} failed: {e!r}')
+            job.status = 'failed'
+            job.error = str(e)
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status != 'pending']
+        for job_id in finished[:max(len(finished) - max_finished_jobs, 0)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job, timeout=None):
+        """
+        Wait until job is finished.
+
+        :param job: ReportJob instance
+        :param timeout: maximum time to wait in seconds, None to wait until the job is finished
+        :return: None
+        """
+        await asyncio.wait([job.task], timeout=timeout)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+def report_path(digest):
+    """Path of the stored report file with the given content digest."""
+    return os.path.join(reports_directory, f'{digest}.pdf')
+
+
+def store_document(path, document):
+    """
+    Write rendered document unless a file with the same content already exists.
+
+    :param path: content-addressed file path
+    :param document: document bytes
+    :return: None
+    """
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(document)
+    os.replace(temporary_path, path)
+
+
+async def close_report_jobs(app):
+    app.report_jobs.close()
@@ -3,6 +3,70 @@ import datetime
 from fpdf import FPDF
 
 
+class ReportResources:
+    """
+    Fonts and images parsed once per process and shared by all report documents rendered by it.
+    FPDF only reuses them within a single document, so without the cache every report
+    loads font metrics and decodes every PNG again.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # font key and (font entry, font file entries) as registered by FPDF.add_font
+        self.fonts = {}
+        # image path and image info as parsed by FPDF.image
+        self.images = {}
+
+    def add_font(self, pdf, font_name, font_path):
+        """
+        Register TrueType font in a document, parsing it only the first time in this process.
+
+        :param pdf: FPDF instance
+        :param font_name: font family name
+        :param font_path: path to the .ttf file
+        :return: None
+        """
+        fontkey = font_name.lower()
+        if fontkey in pdf.fonts:
+            return
+        cached = self.fonts.get(fontkey)
+        if cached is None:
+            pdf.add_font(font_name, '', font_path, uni=True)
+            font = pdf.fonts[fontkey]
+            self.fonts[fontkey] = (dict(font, subset=list(font['subset'])),
+                                   {name: dict(pdf.font_files[name]) for name in (fontkey, font_path)})
+            return
+        font, font_files = cached
+        # per document state: font number, used characters (subset) and object number set on output
+        pdf.fonts[fontkey] = dict(font, i=len(pdf.fonts) + 1, subset=list(font['subset']))
+        for name, font_file in font_files.items():
+            pdf.font_files[name] = dict(font_file)
+
+    def add_image(self, pdf, name):
+        """
+        Register image in a document before it is placed, parsing it only the first time in this process.
+
+        :param pdf: FPDF instance
+        :param name: image path
+        :return: None
+        """
+        if name in pdf.images or name not in self.images:
+            return
+        info = self.images[name]
+        # FPDF deletes image data from the info on output, so every document gets its own copy of the dict
+        pdf.images[name] = dict(info, i=len(pdf.images) + 1)
+        if 'smask' in info and pdf.pdf_version < '1.4':
+            # set by FPDF when it parses a PNG with alpha channel
+            pdf.pdf_version = '1.4'
+
+    def store_image(self, pdf, name):
+        if name not in self.images:
+            self.images[name] = {key: value for key, value in pdf.images[name].items() if key not in ('i', 'n')}
+
+
+report_resources = ReportResources()
+
+
 class ReportTemplate(FPDF):
 
     def __init__(self, test_info, orientation='P', unit='mm', format='A4'):
@@ -30,7 +94,12 @@ class ReportTemplate(FPDF):
 
     def load_custom_fonts(self, fonts):
         for font_name, font_path in fonts.items():
-            self.add_font(font_name, '', font_path, uni=True)
+            report_resources.add_font(self, font_name, font_path)
+
+    def image(self, name, x=None, y=None, w=0, h=0, type='', link=''):
+        report_resources.add_image(self, name)
+        super().image(name, x, y, w, h, type, link)
+        report_resources.store_image(self, name)
 
     def place_header_field(self, field_name, field_value, name_width, value_width, header_row_height, text_size=10):
         self.set_font('OpenSans-Regular', size=text_size)
@@ -243,7 +312,16 @@ class TestInfo:
         self.report_status_image = report_status_image
 
 
-def generate_report(filename, test_data, mold_no, mold_type, tester_name):
+def generate_report(test_data, mold_no, mold_type, tester_name):
+    """
+    Render test report. Runs in a report worker process, so everything passed has to be picklable.
+
+    :param test_data: dict with mould side names as keys and dicts with x, y, label and status lists as values
+    :param mold_no: mould number
+    :param mold_type: mould configuration name
+    :param tester_name: name of the tester
+    :return: PDF document as bytes
+    """
     def get_side_info(x_list, y_list, label_list, status_list):
         y_map = {
             y: row for row, y in enumerate(sorted(set(y_list), reverse=True))
@@ -278,4 +356,25 @@ def generate_report(filename, test_data, mold_no, mold_type, tester_name):
     test_info = TestInfo(tester_name, mold_type, mold_no, layout, report_status_image)
     pdf = ReportTemplate(test_info, format='A4')
     pdf.generate_report()
-    pdf.output(f"static/reports/{filename}.pdf")
+    # FPDF 1.7 returns the document as a latin-1 string
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def build_report_data(station):
+    """
+    Collect report data of the current test session of a mould station.
+
+    :param station: MouldStation instance
+    :return: dict of mould side names and their thermocouple coordinates, labels and statuses
+    """
+    data = {}
+    test_results = station.test_session.test_results
+    for mold_side in [mold_side.name for mold_side in station.mold_config.mold_sides]:
+        mold_side_tcs = station.get_side_tcs(mold_side)
+        data[mold_side] = {
+            'x': [tc.x for tc in mold_side_tcs],
+            'y': [tc.y for tc in mold_side_tcs],
+            'label': [tc.label for tc in mold_side_tcs],
+            'status': [test_results.get_result(tc.label) or tc.status for tc in mold_side_tcs],
+        }
+    return data
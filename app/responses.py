@@ -0,0 +1,98 @@
+"""
+responses.py builds JSON responses of API endpoints.
+orjson is used for serialization if it is installed, otherwise the standard json module.
+Responses above compress_min_size bytes are compressed with gzip or deflate if the client accepts it.
+"""
+import gzip
+import json
+
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# smaller responses are sent as they are, compression would not pay off
+compress_min_size = 1024
+compress_level = 6
+
+
+def dumps(data):
+    """
+    Serialize data to JSON.
+
+    :param data: data to serialize, NaN is not allowed in floats
+    :return: UTF-8 encoded JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+def json_response(data, status=200):
+    """
+    Build JSON response of an API endpoint. Compression is negotiated by aiohttp when the response is sent.
+
+    :param data: data to serialize
+    :param status: HTTP status code
+    :return: response
+    """
+    body = dumps(data)
+    response = web.Response(body=body, status=status, content_type='application/json')
+    if len(body) >= compress_min_size:
+        response.enable_compression()
+    return response
+
+
+def compress(body):
+    """
+    Compress prebuilt body once, so it can be sent to many clients without compressing it again.
+
+    :param body: response body
+    :return: gzip compressed body or None if the body is too small to be compressed
+    """
+    if len(body) < compress_min_size:
+        return None
+    return gzip.compress(body, compress_level)
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+
+def etag_matches(request, etag):
+    """
+    Check If-None-Match of a request with weak comparison, as required for GET requests.
+
+    :param request: request instance
+    :param etag: quoted entity tag of the current representation
+    :return: True if the client already has the representation
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+def snapshot_response(request, snapshot, cache_control='no-cache'):
+    """
+    Respond with a prebuilt snapshot or with 304 Not Modified if the client already has it.
+
+    :param request: request instance
+    :param snapshot: Snapshot instance
+    :param cache_control: Cache-Control header value, by default clients have to revalidate every time
+    :return: response
+    """
+    headers = {'ETag': snapshot.etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    if etag_matches(request, snapshot.etag):
+        raise web.HTTPNotModified(headers=headers)
+    content_type = 'application/json' if snapshot.text is not None else 'application/octet-stream'
+    body = snapshot.body
+    if snapshot.compressed is not None and accepts_gzip(request):
+        body = snapshot.compressed
+        headers['Content-Encoding'] = 'gzip'
+    return web.Response(body=body, content_type=content_type, headers=headers)
@@ -0,0 +1,147 @@
+"""
+rollups.py keeps aggregated temperature history of a mould at several coarser resolutions,
+so long time ranges can be served without reading every raw sample.
+"""
+import numpy as np
+
+# (bucket length in seconds, number of buckets kept) for every resolution, from the finest one
+rollup_resolutions = ((1, 3600), (10, 2160), (60, 1440))
+rollup_statistics = ('min', 'max', 'mean', 'last')
+
+
+class RollupLevel:
+    """
+    Aggregates of all thermocouples in fixed time buckets of a single resolution.
+    Samples are accumulated into the open bucket as they arrive; when a sample of a later bucket arrives,
+    the open bucket is closed and written into mirrored ring buffers (same layout as HistoryStore),
+    one [tc_count, capacity] float32 matrix per statistic.
+    """
+
+    def __init__(self, tc_count, resolution, capacity) -> None:
+        super().__init__()
+        self.tc_count = tc_count
+        self.resolution = resolution
+        self.capacity = capacity
+        self._times = np.zeros(2 * capacity, dtype=np.float64)
+        self._stats = {name: np.full((tc_count, 2 * capacity), np.nan, dtype=np.float32)
+                       for name in rollup_statistics}
+        # total number of closed buckets
+        self.count = 0
+        # first sample time ever added, the level has no data before it
+        self.start_time = None
+        # start time and accumulators of the open bucket
+        self.bucket_start = None
+        self._min = np.full(tc_count, np.nan)
+        self._max = np.full(tc_count, np.nan)
+        self._sum = np.zeros(tc_count)
+        self._count = np.zeros(tc_count, dtype=np.int64)
+        self._last = np.full(tc_count, np.nan)
+
+    def add_sample(self, time, temperatures):
+        """
+        Add one sample of all thermocouples to the open bucket, closing it first if the sample belongs to a later one.
+        NaN temperatures are ignored by all statistics.
+
+        :param time: POSIX timestamp of the sample
+        :param temperatures: array of temperatures in thermocouple order, NaN if unknown
+        :return: None
+        """
+        bucket_start = time - time % self.resolution
+        if self.bucket_start is None:
+            self.start_time = time
+            self.bucket_start = bucket_start
+        elif bucket_start > self.bucket_start:
+            self._close_bucket()
+            self.bucket_start = bucket_start
+        known = ~np.isnan(temperatures)
+        np.fmin(self._min, temperatures, out=self._min)
+        np.fmax(self._max, temperatures, out=self._max)
+        self._sum[known] += temperatures[known]
+        self._count += known
+        self._last[known] = temperatures[known]
+
+    def _open_bucket_stats(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self._count > 0, self._sum / self._count, np.nan)
+        return {'min': self._min, 'max': self._max, 'mean': mean, 'last': self._last}
+
+    def _close_bucket(self):
+        position = self.count % self.capacity
+        mirror = position + self.capacity
+        self._times[position] = self._times[mirror] = self.bucket_start
+        for name, values in self._open_bucket_stats().items():
+            self._stats[name][:, position] = values
+            self._stats[name][:, mirror] = values
+        self.count += 1
+        self._min.fill(np.nan)
+        self._max.fill(np.nan)
+        self._sum.fill(0)
+        self._count.fill(0)
+        self._last.fill(np.nan)
+
+    @property
+    def _window(self):
+        length = min(self.count, self.capacity)
+        start = self.count % self.capacity if self.count >= self.capacity else 0
+        return slice(start, start + length)
+
+    @property
+    def oldest_time(self):
+        """Start of the oldest moment this level has data for or None if it is empty."""
+        if self.count > self.capacity:
+            return self._times[self._window][0]
+        return self.start_time
+
+    def covers(self, time_from):
+        return self.oldest_time is not None and time_from >= self.oldest_time
+
+    def read_range(self, time_from, time_to, index):
+        """
+        Read buckets that start between two moments, including the open bucket.
+
+        :param time_from: POSIX timestamp, start of the range (inclusive)
+        :param time_to: POSIX timestamp, end of the range (inclusive)
+        :param index: thermocouple row index
+        :return: tuple of bucket start times array and dict of statistic name and values array
+        """
+        window = self._window
+        times = self._times[window]
+        start = int(np.searchsorted(times, time_from - time_from % self.resolution, side='left'))
+        end = int(np.searchsorted(times, time_to, side='right'))
+        times = times[start:end]
+        stats = {name: values[index, window][start:end] for name, values in self._stats.items()}
+        if self.bucket_start is not None and self.bucket_start <= time_to:
+            times = np.append(times, self.bucket_start)
+            for name, values in self._open_bucket_stats().items():
+                stats[name] = np.append(stats[name], np.float32(values[index]))
+        return times, stats
+
+
+class RollupStore:
+    """
+    Rollups of all thermocouples of a mould at every resolution of rollup_resolutions.
+    """
+
+    def __init__(self, tc_count, resolutions=rollup_resolutions) -> None:
+        super().__init__()
+        self.levels = [RollupLevel(tc_count, resolution, capacity) for resolution, capacity in resolutions]
+
+    def add_sample(self, time, temperatures):
+        for level in self.levels:
+            level.add_sample(time, temperatures)
+
+    def find_level(self, time_from, time_to, max_points):
+        """
+        Find the finest resolution that has data for the whole range and fits the range into max_points buckets.
+        Every level within the point budget costs about the same to serve, and the coarsest level always fits it,
+        so the finest fitting level is taken, as it returns the most detail for the same budget.
+
+        :param time_from: POSIX timestamp, start of the range
+        :param time_to: POSIX timestamp, end of the range
+        :param max_points: maximum number of buckets
+        :return: RollupLevel instance or None if no level fits
+        """
+        for level in self.levels:
+            if level.covers(time_from) and (time_to - time_from) / level.resolution + 1 <= max_points:
+                return level
+        return None
@@ -1,6 +1,7 @@
 """
 This module lists all endpoints of the server
 """
+from live_updates import get_live_updates
 from views import (
     get_tc_data,
     autotest_confirmation,
@@ -12,28 +13,51 @@ from views import (
     get_test_page,
     get_new_test_session,
     get_heatmap_update,
+    get_heatmap_frame,
+    get_heatmap_geometry,
     post_test_direction,
     get_session_info,
     get_report,
+    post_report_job,
+    get_report_job_status,
+    get_report_job_pdf,
     get_reports_page,
+    get_archived_report,
+    get_history_export,
+    get_tests_export,
 )
 
+# every route is available both without prefix (served by the first mould)
+# and scoped to a mould station as /moulds/{mould_id}/...
+mould_prefix = '/moulds/{mould_id}'
+
 
 def setup_routes(app):
-    # pages
-    app.router.add_get('/', get_start_page)
-    app.router.add_get('/test-mould', get_mold_side_selection_page)
-    app.router.add_get('/test-mould/side', get_test_page)
-    app.router.add_get('/settings', get_autotest_config)
-    app.router.add_get('/reports', get_reports_page)
-    # regular updates
-    app.router.add_get('/heatmap-data', get_heatmap_update)
-    app.router.add_get('/tc-data', get_tc_data)
-    app.router.add_get('/session-info', get_session_info)
-    # queries/operations
-    app.router.add_get('/new-test', get_new_test_session)
-    app.router.add_post('/test-direction', post_test_direction)
-    app.router.add_post('/settings', post_autotest_config)
-    app.router.add_post('/autotest-confirmation', autotest_confirmation)
-    app.router.add_post('/mantest', post_manual_test)
-    app.router.add_get('/report', get_report)
+    for prefix in ('', mould_prefix):
+        # pages
+        app.router.add_get(prefix + '/', get_start_page)
+        app.router.add_get(prefix + '/test-mould', get_mold_side_selection_page)
+        app.router.add_get(prefix + '/test-mould/side', get_test_page)
+        app.router.add_get(prefix + '/settings', get_autotest_config)
+        app.router.add_get(prefix + '/reports', get_reports_page)
+        # data that does not change while the server runs
+        app.router.add_get(prefix + '/heatmap-geometry', get_heatmap_geometry)
+        # regular updates
+        app.router.add_get(prefix + '/heatmap-data', get_heatmap_update)
+        app.router.add_get(prefix + '/heatmap-frame', get_heatmap_frame)
+        app.router.add_get(prefix + '/tc-data', get_tc_data)
+        app.router.add_get(prefix + '/session-info', get_session_info)
+        app.router.add_get(prefix + '/live', get_live_updates)
+        # queries/operations
+        app.router.add_get(prefix + '/new-test', get_new_test_session)
+        app.router.add_post(prefix + '/test-direction', post_test_direction)
+        app.router.add_post(prefix + '/settings', post_autotest_config)
+        app.router.add_post(prefix + '/autotest-confirmation', autotest_confirmation)
+        app.router.add_post(prefix + '/mantest', post_manual_test)
+        app.router.add_get(prefix + '/report', get_report)
+        app.router.add_post(prefix + '/reports', post_report_job)
+        app.router.add_get(prefix + '/reports/{job_id}', get_report_job_status)
+        app.router.add_get(prefix + '/reports/{job_id}/pdf', get_report_job_pdf)
+        app.router.add_get(prefix + '/archive/{session_id}/report', get_archived_report)
+        app.router.add_get(prefix + '/export/history.{format:csv|bin}', get_history_export)
+        app.router.add_get(prefix + '/export/tests.csv', get_tests_export)
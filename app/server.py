@@ -2,18 +2,35 @@ import aiohttp_jinja2
 import jinja2
 from aiohttp import web
 
+from archive import close_archive
 from background_tasks import start_background_tasks, cleanup_background_tasks
+from live_updates import close_live_updates
+from report_jobs import close_report_jobs
 from routes import setup_routes
+from station import station_context_processor
 from utils import init_app
 
-app = web.Application()
-app = init_app(app)
+def create_app():
+    """
+    Build the application. Kept out of module level, because report worker processes
+    are spawned and import __main__ again, they must not start stations and a second server.
+    """
+    app = web.Application()
+    app = init_app(app)
 
-app.router.add_static('/static/', path='static', name='static')
-aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader('templates'))
+    app.router.add_static('/static/', path='static', name='static')
+    aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader('templates'),
+                         context_processors=[station_context_processor])
 
-app.on_startup.append(start_background_tasks)
-app.on_cleanup.append(cleanup_background_tasks)
+    app.on_startup.append(start_background_tasks)
+    app.on_shutdown.append(close_live_updates)
+    app.on_cleanup.append(cleanup_background_tasks)
+    app.on_cleanup.append(close_report_jobs)
+    app.on_cleanup.append(close_archive)
 
-setup_routes(app)
-web.run_app(app)
+    setup_routes(app)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app())
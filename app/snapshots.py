@@ -0,0 +1,228 @@
+"""
+snapshots.py builds heatmap and test session data of mould sides once per acquisition tick.
+Built data is serialized right away and shared by all requests and live update clients until the next tick.
+"""
+import hashlib
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from connection import ConnectionState
+from responses import compress, dumps
+from testing import TestLane
+
+# serialized response: JSON text (None for binary data), its bytes, an ETag derived from the content
+# and gzip compressed bytes (None if the body is too small to be compressed)
+Snapshot = namedtuple('Snapshot', ['text', 'body', 'etag', 'compressed'])
+
+# Binary heatmap frame, little-endian, thermocouples in geometry order:
+# header (geometry version, thermocouple count n, flags, error length in bytes),
+# float32[n] temperatures (NaN if unknown), uint8[n] statuses (see frame_status_codes),
+# three bitmaps of ceil(n / 8) bytes - successful, failed and current test (bit i of byte i // 8 is thermocouple i),
+# UTF-8 error message.
+frame_header = struct.Struct('<8sIII')
+frame_status_codes = {'': 0, 'OK': 1, 'Disconnected': 2}
+frame_flag_stale = 1
+frame_flag_error = 2
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def make_snapshot(data):
+    body = dumps(data)
+    return Snapshot(body.decode(), body, make_etag(body), compress(body))
+
+
+def make_binary_snapshot(body):
+    return Snapshot(None, body, make_etag(body), compress(body))
+
+
+class SideSnapshot:
+    """
+    Heatmap, session and binary heatmap frame snapshots of a mould side at a station state version.
+    Every snapshot is built on first access, so a request only pays for the data it sends.
+    """
+
+    def __init__(self, station, mold_side) -> None:
+        super().__init__()
+        self.station = station
+        self.mold_side = mold_side
+        self.version = station.state_version
+        self._heatmap = None
+        self._session = None
+        self._frame = None
+
+    @property
+    def heatmap(self):
+        if self._heatmap is None:
+            self._heatmap = make_snapshot(build_heatmap_update(self.station, self.mold_side))
+        return self._heatmap
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = make_snapshot(build_session_info(self.station, self.mold_side))
+        return self._session
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = make_binary_snapshot(build_heatmap_frame(self.station, self.mold_side))
+        return self._frame
+
+
+def get_side_snapshot(station, mold_side):
+    """
+    Get snapshot of a mould side, starting a new one if the station state has changed since it was started.
+
+    :param station: MouldStation instance
+    :param mold_side: name of the mould side
+    :return: SideSnapshot instance
+    """
+    snapshot = station.snapshots.get(mold_side)
+    if snapshot is None or snapshot.version != station.state_version:
+        snapshot = station.snapshots[mold_side] = SideSnapshot(station, mold_side)
+    return snapshot
+
+
+def get_side_geometry(station, mold_side):
+    """
+    Get positions and labels of thermocouples of a mould side. Built once, as they never change.
+
+    :param station: MouldStation instance
+    :param mold_side: name of the mould side
+    :return: Snapshot instance
+    """
+    if mold_side not in station.geometry:
+        mold_side_tcs = station.get_side_tcs(mold_side)
+        station.geometry[mold_side] = make_snapshot({
+            'version': station.geometry_version.hex(),
+            'x': [tc.x for tc in mold_side_tcs],
+            'y': [tc.y for tc in mold_side_tcs],
+            'label': [tc.label for tc in mold_side_tcs],
+        })
+    return station.geometry[mold_side]
+
+
+def get_side_error(station, mold_side):
+    """
+    :param station: MouldStation instance
+    :param mold_side: name of the mould side
+    :return: error message if data of the mould side is not available, otherwise None
+    """
+    if station.wlanbox.connection.state != ConnectionState.CONNECTED:
+        return 'PLC unreachable'
+    slave_state = station.mold_side_states[mold_side]
+    if slave_state != 'No error':
+        return slave_state
+    return None
+
+
+def build_heatmap_frame(station, mold_side):
+    """
+    Build binary heatmap frame of a mould side, see frame_header for the format.
+
+    :param station: MouldStation instance
+    :param mold_side: name of the mould side
+    :return: bytes
+    """
+    mold_side_tcs = station.get_side_tcs(mold_side)
+    count = len(mold_side_tcs)
+    error = get_side_error(station, mold_side)
+    flags = frame_flag_stale if station.frame_is_stale else 0
+    if error:
+        flags |= frame_flag_error
+        temperatures = np.full(count, np.nan, dtype='<f4')
+        statuses = np.zeros(count, dtype=np.uint8)
+        test_states = np.zeros((3, count), dtype=bool)
+    else:
+        temperatures = np.array([np.nan if tc.temperature is None else tc.temperature for tc in mold_side_tcs],
+                                dtype='<f4')
+        statuses = np.array([frame_status_codes.get(tc.status, 0) for tc in mold_side_tcs], dtype=np.uint8)
+        test_states = np.array(get_side_test_states(station, mold_side, mold_side_tcs), dtype=bool)
+    error = (error or '').encode()
+    return b''.join([
+        frame_header.pack(station.geometry_version, count, flags, len(error)),
+        temperatures.tobytes(),
+        statuses.tobytes(),
+        np.packbits(test_states, axis=1, bitorder='little').tobytes(),
+        error,
+    ])
+
+
+def get_side_test_states(station, mold_side, mold_side_tcs):
+    """
+    :param station: MouldStation instance
+    :param mold_side: name of the mould side
+    :param mold_side_tcs: list of thermocouples of the mould side
+    :return: lists of successful, failed and current test flags of the thermocouples
+    """
+    test_session = station.test_session
+    results = [test_session.test_results.get_result(tc.label) for tc in mold_side_tcs]
+    current_test = get_current_test_label(test_session, mold_side)
+    return ([result == "success" for result in results],
+            [result == "fail" for result in results],
+            [tc.label == current_test for tc in mold_side_tcs])
+
+
+def get_current_test_label(test_session, mold_side):
+    lane = test_session.lanes.get(mold_side)
+    if lane is None:
+        return None
+    if lane.completed_test:
+        return lane.completed_test.tc.label
+    elif lane.current_test:
+        return lane.current_test.tc.label
+    return None
+
+
+def build_session_info(station, mold_side):
+    mold_side_tcs = station.get_side_tcs(mold_side)
+    test_session = station.test_session
+    ordering = test_session.get_ordering(mold_side_tcs)
+    lane = test_session.lanes.get(mold_side) or TestLane(mold_side)
+    completed_info = lane.completed_test.to_dict() if lane.completed_test else None
+    current_direction = test_session.direction.name.lower()
+    if lane.current_test and lane.current_test.is_manual:
+        current_direction = 'manual'
+    return {
+        'completed': completed_info,
+        'ordering': ordering,
+        'current_mode': current_direction,
+        'counts': test_session.test_results.get_side_counts(mold_side),
+    }
+
+
+def build_heatmap_update(station, request_mold_side):
+    errors = get_side_error(station, request_mold_side)
+    if errors:
+        heatmap_data = {}
+    else:
+        mold_side_tcs = station.get_side_tcs(request_mold_side)
+        test_session = station.test_session
+        test_results = test_session.test_results
+        statuses = [tc.status for tc in mold_side_tcs]
+        successful_tests = test_results.get_labels("success")
+        failed_tests = test_results.get_labels("fail")
+        current_test = get_current_test_label(test_session, request_mold_side)
+        heatmap_data = {
+            'x': [tc.x for tc in mold_side_tcs],
+            'y': [tc.y for tc in mold_side_tcs],
+            'temperature': [tc.temperature for tc in mold_side_tcs],
+            'label': [tc.label for tc in mold_side_tcs],
+            'status': statuses,
+            'test': {
+                'successful': successful_tests,
+                'failed': failed_tests,
+                'current': current_test,
+            }
+        }
+    return {
+        'error': errors,
+        'stale': station.frame_is_stale,
+        'connection': station.wlanbox.connection.to_dict(),
+        'data': heatmap_data,
+    }
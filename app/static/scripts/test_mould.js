@@ -4,5 +4,5 @@ $(".btn-test-mouldside").click(function () {
     // make sure the first letter is upper case
     sideName = sideName.charAt(0).toUpperCase() + sideName.slice(1);
     // move to test endpoint
-    window.location = '/test-mould/side?mold_side=' + sideName;
+    window.location = mouldPrefix + '/test-mould/side?mold_side=' + sideName;
 });
\ No newline at end of file
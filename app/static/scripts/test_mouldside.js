@@ -28,51 +28,242 @@ $(document).ready($ => {
     heatMapElement.on('plotly_click', (data) => {
         heatmapClick(data)
     });
-    setInterval(updateByInterval, 200);
+    loadHeatmapGeometry(heatMapInfo.geometryVersion);
+    connectLiveUpdates();
 });
 
+let liveSocket = null;
+let pollingTimer = null;
+
+// live updates are pushed over a WebSocket, polling is used if it is not available
+function connectLiveUpdates() {
+    if (!('WebSocket' in window)) {
+        startPolling();
+        return;
+    }
+    let protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+    let socket = new WebSocket(protocol + window.location.host + mouldPrefix + '/live');
+    socket.binaryType = 'arraybuffer';
+    socket.onopen = () => {
+        stopPolling();
+        liveSocket = socket;
+        subscribeLiveUpdates();
+    };
+    socket.onmessage = (event) => {
+        if (event.data instanceof ArrayBuffer) {
+            heatmapFrameUpdate(event.data);
+            return;
+        }
+        let update = JSON.parse(event.data);
+        if (update.session) {
+            sessionInfoUpdate(update.session);
+            mergeTcGraphData($('#selected-tc').text(), update.tc);
+        }
+    };
+    socket.onclose = () => {
+        liveSocket = null;
+        startPolling();
+        // try to switch back to live updates later
+        setTimeout(connectLiveUpdates, 5000);
+    };
+}
+
+function subscribeLiveUpdates() {
+    if (liveSocket) {
+        liveSocket.send(JSON.stringify({mold_side: heatMapInfo.moldSide, tc: $('#selected-tc').text()}));
+    }
+}
+
+function startPolling() {
+    if (pollingTimer === null) {
+        pollingTimer = setInterval(updateByInterval, 200);
+    }
+}
+
+function stopPolling() {
+    if (pollingTimer !== null) {
+        clearInterval(pollingTimer);
+        pollingTimer = null;
+    }
+}
+
+function setSelectedTc(label) {
+    if ($('#selected-tc').text() !== String(label)) {
+        $('#selected-tc').text(label);
+        subscribeLiveUpdates();
+    }
+}
+
 function heatmapClick(data) {
     for (let i = 0; i < data.points.length; i++) {
         if (data.points[i].data.type === "scatter") {
             let selectedTcText = data.points[i].text;
             let selectedTcNum = selectedTcText.match(/\d+/g)[0];
-            $('#selected-tc').text(selectedTcNum);
+            setSelectedTc(selectedTcNum);
             break;
         }
     }
 }
 
 function updateByInterval() {
-    $.getJSON('/heatmap-data', {mold_side: heatMapInfo.moldSide}, (response) => {
-        let graphTitle = heatMapInfo.graphTitle;
-        if (response.error) {
-            $('#graph-title').text(graphTitle + ' Error: ' + response.error)
-        } else {
-            $('#graph-title').text(graphTitle);
+    fetch(mouldPrefix + '/heatmap-frame?' + $.param({mold_side: heatMapInfo.moldSide}))
+        .then((response) => response.arrayBuffer())
+        .then(heatmapFrameUpdate);
+    $.getJSON(mouldPrefix + '/session-info', {mold_side: heatMapInfo.moldSide}, sessionInfoUpdate);
+    tcGraphPoll();
+}
+
+// thermocouple graph data received so far, polling only asks for samples after its cursor
+let tcGraphData = null;
+
+function tcGraphPoll() {
+    let tc = $('#selected-tc').text();
+    let params = {tc: tc};
+    if (tcGraphData && tcGraphData.tc === tc) {
+        params.since = tcGraphData.cursor;
+    }
+    $.getJSON(mouldPrefix + '/tc-data', params, (response) => {
+        if (response.reset === false && tcGraphData && params.since !== tcGraphData.cursor) {
+            // an overlapping request has already appended these samples
+            return;
         }
-        let plotData = response.data;
-        heatmapUpdate(plotData);
-        // enable or disable manual testing button
-        manualTestingButtonUpdate(plotData);
-        // switch tc graph to currently tested TC
-        selectedTcUpdate(plotData);
+        mergeTcGraphData(tc, response);
     });
-    $.getJSON('/session-info', {mold_side: heatMapInfo.moldSide}, (response) => {
-        if (response.ordering.length > 0) {
-            $('#ordering').text("Expected order: " + response.ordering);
-        } else {
-            $('#ordering').text("All thermocouples on this side are tested.");
+}
+
+// response holds the whole window, or only samples after the cursor of the previous one if reset is false
+function mergeTcGraphData(tc, response) {
+    if (response.reset === false) {
+        if (!tcGraphData || tcGraphData.tc !== tc || tcGraphData.name !== response.name) {
+            // samples of a previously selected thermocouple
+            return;
         }
-        // update modal status
-        modalWindowUpdate(response);
-        // update toolbar buttons order
-        toolBarButtonsUpdate(response);
-    });
-    $.getJSON('/tc-data', {tc: $('#selected-tc').text()}, (response) => {
-        tcGraphUpdate(response)
+        let start = Math.max(tcGraphData.time.length + response.time.length - response.capacity, 0);
+        tcGraphData.time = tcGraphData.time.concat(response.time).slice(start);
+        tcGraphData.temperature = tcGraphData.temperature.concat(response.temperature).slice(start);
+        tcGraphData.cursor = response.cursor;
+    } else {
+        tcGraphData = Object.assign({tc: tc}, response);
+    }
+    tcGraphUpdate(tcGraphData);
+}
+
+// positions and labels of thermocouples, loaded once, frames only carry the changing data
+let heatmapGeometry = null;
+let heatmapGeometryLoading = false;
+
+function loadHeatmapGeometry(version) {
+    if (heatmapGeometryLoading) {
+        return;
+    }
+    heatmapGeometryLoading = true;
+    $.getJSON(mouldPrefix + '/heatmap-geometry', {mold_side: heatMapInfo.moldSide, v: version}, (response) => {
+        heatmapGeometry = response;
+    }).always(() => {
+        heatmapGeometryLoading = false;
     });
 }
 
+// binary heatmap frame, see snapshots.py for the format
+function decodeHeatmapFrame(buffer) {
+    let view = new DataView(buffer);
+    let version = Array.from(new Uint8Array(buffer, 0, 8), (byte) => byte.toString(16).padStart(2, '0')).join('');
+    let count = view.getUint32(8, true);
+    let flags = view.getUint32(12, true);
+    let errorLength = view.getUint32(16, true);
+    let offset = 20;
+    let temperature = new Float32Array(buffer, offset, count);
+    offset += 4 * count;
+    let status = new Uint8Array(buffer, offset, count);
+    offset += count;
+    let bitmapLength = Math.ceil(count / 8);
+    let bitmaps = [];
+    for (let i = 0; i < 3; i++) {
+        bitmaps.push(new Uint8Array(buffer, offset, bitmapLength));
+        offset += bitmapLength;
+    }
+    let error = new TextDecoder().decode(new Uint8Array(buffer, offset, errorLength));
+    return {
+        version: version,
+        count: count,
+        stale: (flags & 1) !== 0,
+        error: (flags & 2) !== 0 ? error : null,
+        temperature: temperature,
+        status: status,
+        successful: bitmaps[0],
+        failed: bitmaps[1],
+        current: bitmaps[2],
+    };
+}
+
+const frameStatuses = ['', 'OK', 'Disconnected'];
+
+function heatmapFrameUpdate(buffer) {
+    let frame = decodeHeatmapFrame(buffer);
+    if (heatmapGeometry === null || heatmapGeometry.version !== frame.version) {
+        loadHeatmapGeometry(frame.version);
+        return;
+    }
+    let isSet = (bitmap, i) => ((bitmap[i >> 3] >> (i & 7)) & 1) === 1;
+    let plotData = {};
+    if (frame.error === null) {
+        plotData = {
+            x: heatmapGeometry.x,
+            y: heatmapGeometry.y,
+            label: heatmapGeometry.label,
+            temperature: [],
+            status: [],
+            test: {successful: [], failed: [], current: null},
+        };
+        for (let i = 0; i < frame.count; i++) {
+            let label = heatmapGeometry.label[i];
+            let temperature = frame.temperature[i];
+            plotData.temperature.push(isNaN(temperature) ? null : Math.round(temperature * 100) / 100);
+            plotData.status.push(frameStatuses[frame.status[i]]);
+            if (isSet(frame.successful, i)) {
+                plotData.test.successful.push(label);
+            }
+            if (isSet(frame.failed, i)) {
+                plotData.test.failed.push(label);
+            }
+            if (isSet(frame.current, i)) {
+                plotData.test.current = label;
+            }
+        }
+    }
+    heatmapResponseUpdate({stale: frame.stale, error: frame.error, data: plotData});
+}
+
+function heatmapResponseUpdate(response) {
+    let graphTitle = heatMapInfo.graphTitle;
+    if (response.stale) {
+        graphTitle += ' (stale data)';
+    }
+    if (response.error) {
+        $('#graph-title').text(graphTitle + ' Error: ' + response.error)
+    } else {
+        $('#graph-title').text(graphTitle);
+    }
+    let plotData = response.data;
+    heatmapUpdate(plotData);
+    // enable or disable manual testing button
+    manualTestingButtonUpdate(plotData);
+    // switch tc graph to currently tested TC
+    selectedTcUpdate(plotData);
+}
+
+function sessionInfoUpdate(response) {
+    if (response.ordering.length > 0) {
+        $('#ordering').text("Expected order: " + response.ordering);
+    } else {
+        $('#ordering').text("All thermocouples on this side are tested.");
+    }
+    // update modal status
+    modalWindowUpdate(response);
+    // update toolbar buttons order
+    toolBarButtonsUpdate(response);
+}
+
 function heatmapUpdate(plotData) {
     function getTcColors(plotData) {
         let colors = [];
@@ -217,8 +408,8 @@ function toolBarButtonsUpdate(response) {
 }
 
 function selectedTcUpdate(plotData) {
-    if (plotData.test.current) {
-        $('#selected-tc').text(plotData.test.current)
+    if (plotData.test && plotData.test.current) {
+        setSelectedTc(plotData.test.current)
     }
 }
 
@@ -236,19 +427,21 @@ function tcGraphUpdate(response) {
 $("#btn-fail").click(function () {
     let data = JSON.stringify({
         result: 'fail',
+        mold_side: heatMapInfo.moldSide,
     });
-    $.post("/autotest-confirmation", data);
+    $.post(mouldPrefix + "/autotest-confirmation", data);
 });
 $("#btn-ok").click(function () {
     let data = JSON.stringify({
         result: 'success',
+        mold_side: heatMapInfo.moldSide,
     });
-    $.post("/autotest-confirmation", data);
+    $.post(mouldPrefix + "/autotest-confirmation", data);
 });
 
 // manual test
 $("#btn-test").click(function () {
-    $.post("/mantest", {tc: $('#selected-tc').text()}, function (data) {
+    $.post(mouldPrefix + "/mantest", {tc: $('#selected-tc').text()}, function (data) {
         console.log(data);
         $("#btn-test").trigger("blur");
         this.blur();
@@ -256,6 +449,6 @@ $("#btn-test").click(function () {
 });
 // switching test direction
 $(".test-direction-button").click(function () {
-    $.post("/test-direction", {direction: this.id});
+    $.post(mouldPrefix + "/test-direction", {direction: this.id});
     this.blur();
 });
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+station.py describes a mould station: one mould hosted by the server together with its own
+thermocouples, WLAN box connection, acquisition and test session.
+"""
+import numpy as np
+from aiohttp import web
+
+from history import HistoryStore
+from mold_config import tcs_from_config, get_channel_indices, get_side_indices, get_config_version
+from rollups import RollupStore
+from testing import TestSession
+
+
+class MouldStation:
+    """
+    Stores everything needed for testing a single mould.
+    Acquisition related attributes are set when background tasks are started.
+    """
+
+    def __init__(self, mold_config, wlanbox, disk_history=None) -> None:
+        super().__init__()
+        self.mold_config = mold_config
+        self.tcs = tcs_from_config(mold_config)
+        # thermocouples in history row order
+        self.tc_list = list(self.tcs.values())
+        self.tc_channels = get_channel_indices(self.tcs)
+        self.tc_sides = get_side_indices(self.tcs, mold_config.mold_sides)
+        # thermocouple positions and labels never change, clients cache them by this version
+        self.geometry_version = get_config_version(mold_config)
+        self.history = HistoryStore(len(self.tcs))
+        for index, tc in enumerate(self.tc_list):
+            tc.history = self.history.get_tc_history(index)
+        # True for thermocouples with status OK, in history row order
+        self.tc_active = np.zeros(len(self.tcs), dtype=bool)
+        # min/max/mean/last aggregates at coarser resolutions
+        self.rollups = RollupStore(len(self.tcs))
+        # DiskHistoryStore with long-term history or None if it is disabled
+        self.disk_history = disk_history
+        self.wlanbox = wlanbox
+        self.test_session = TestSession()
+        # LiveUpdateHub pushing updates to WebSocket clients
+        self.live_updates = None
+        self.mold_side_states = {}
+        # incremented on every tick and every change of the test session, invalidates snapshots
+        self.state_version = 0
+        # mould side name and SideSnapshot
+        self.snapshots = {}
+        # mould side name and geometry Snapshot
+        self.geometry = {}
+        self.frame_is_stale = True
+        self.last_frame_at = None
+        self.frames = None
+        self.acquisition = None
+
+    @property
+    def id(self):
+        return self.mold_config.mold_no
+
+    @property
+    def url_prefix(self):
+        return f'/moulds/{self.id}'
+
+    def state_changed(self):
+        self.state_version += 1
+
+    def get_side_tcs(self, mold_side):
+        return [tc for tc in self.tcs.values() if tc.mold_side == mold_side]
+
+
+def get_station(request):
+    """
+    Get the mould station a request is scoped to.
+    Routes without mould id are served by the first configured mould.
+
+    :param request: request instance
+    :return: MouldStation instance
+    """
+    stations = request.app.stations
+    mould_id = request.match_info.get('mould_id')
+    if mould_id is None:
+        return next(iter(stations.values()))
+    try:
+        return stations[mould_id]
+    except KeyError:
+        raise web.HTTPNotFound(text=f'Mould {mould_id} is not hosted by this server.')
+
+
+async def station_context_processor(request):
+    """Provides mould related variables to all templates."""
+    mould_id = request.match_info.get('mould_id')
+    return {
+        'mould_prefix': f'/moulds/{mould_id}' if mould_id else '',
+        'stations': list(request.app.stations.values()),
+    }
@@ -1,116 +1,429 @@
 """
 this module contains business rules that describe testing process.
 """
+from collections import deque
 from datetime import datetime
 from enum import Enum
 
+import numpy as np
+
 
 class GuidedTestingDirection(Enum):
     HORIZONTAL_FIRST = 0
     VERTICAL_FIRST = 1
 
 
+def find_heated_tcs(history, candidates, time_threshold, temperature_threshold):
+    """
+    Check temperature rise over the detection window for all thermocouples at once.
+
+    :param history: HistoryStore with temperature history of all thermocouples
+    :param candidates: boolean array, False for thermocouples that must not be detected (inactive or tested)
+    :param time_threshold: time within which the temperature change must happen
+    :param temperature_threshold: amount of degrees temperature must rise within time limit
+    :return: tuple of bound index of the detection window (None if history is too short)
+    and array of heated thermocouple indices ranked by temperature rise, highest first
+    """
+    bound_index = history.find_threshold_index(time_threshold)
+    if bound_index is None:
+        return None, np.array([], dtype=np.intp)
+    temperatures = history.temperatures
+    rise = temperatures[:, -1] - temperatures[:, bound_index]
+    # comparison is False where any of temperatures is unknown (NaN)
+    heated = np.flatnonzero(candidates & (rise > temperature_threshold))
+    ranking = np.argsort(-rise[heated], kind='stable')
+    return bound_index, heated[ranking]
+
+
+class StreamingRiseDetector:
+    """
+    Incremental heating detector.
+    For every thermocouple it keeps a monotonic deque of (time, temperature) samples within the detection time,
+    so the sliding window minimum is always at the front of the deque.
+    Each new sample is processed in amortized constant time per thermocouple,
+    and the thermocouple is considered heated as soon as its temperature rises above the window minimum
+    by more than detection degrees, so a rise is detected even if the temperature dropped within the window.
+    An unknown temperature breaks the window: only samples after it are taken into account.
+    The deques hold their own samples, so the detection time is not limited by the history buffer.
+    """
+
+    def __init__(self, tc_count, detection_time, detection_degrees) -> None:
+        super().__init__()
+        self.detection_time = detection_time
+        self.detection_seconds = detection_time.total_seconds()
+        self.detection_degrees = detection_degrees
+        self.windows = [deque() for _ in range(tc_count)]
+        # rise of the last sample over the window minimum and time of the minimum, NaN if temperature is unknown
+        self.rise = np.full(tc_count, np.nan)
+        self.min_times = np.full(tc_count, np.nan)
+        # history.count of the last sample processed
+        self.count = 0
+
+    def is_configured_for(self, config):
+        return self.detection_time == config.detection_time and self.detection_degrees == config.detection_degrees
+
+    def update(self, history):
+        """
+        Process samples appended to history since the last update.
+        Samples that have already fallen out of the history buffer are skipped.
+
+        :param history: HistoryStore with temperature history of all thermocouples
+        :return: None
+        """
+        new_samples = min(history.count - self.count, len(history))
+        if new_samples > 0:
+            times = history.times
+            temperatures = history.temperatures
+            for index in range(len(history) - new_samples, len(history)):
+                self.add_sample(float(times[index]), temperatures[:, index])
+        self.count = history.count
+
+    def add_sample(self, time, temperatures):
+        """
+        Process one sample of all thermocouples.
+
+        :param time: POSIX timestamp of the sample
+        :param temperatures: array of temperatures in history row order, NaN if unknown
+        :return: None
+        """
+        window_start = time - self.detection_seconds
+        rise = self.rise
+        min_times = self.min_times
+        for index, (window, temperature) in enumerate(zip(self.windows, temperatures.tolist())):
+            if temperature != temperature:
+                # unknown temperature breaks the window
+                window.clear()
+                rise[index] = min_times[index] = np.nan
+                continue
+            # the newest of equal minimums is kept
+            while window and window[-1][1] >= temperature:
+                window.pop()
+            window.append((time, temperature))
+            while window[0][0] < window_start:
+                window.popleft()
+            min_time, min_temperature = window[0]
+            rise[index] = temperature - min_temperature
+            min_times[index] = min_time
+
+    def find_heated(self, candidates):
+        """
+        :param candidates: boolean array, False for thermocouples that must not be detected (inactive or tested)
+        :return: array of heated thermocouple indices ranked by temperature rise, highest first
+        """
+        heated = np.flatnonzero(candidates & (self.rise > self.detection_degrees))
+        ranking = np.argsort(-self.rise[heated], kind='stable')
+        return heated[ranking]
+
+
+class TestResults:
+    """
+    Results of confirmed thermocouple tests, indexed by thermocouple label, by result and by mould side,
+    with test counters maintained per mould side. Iterating yields tests in confirmation order.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # label and TcTest, in confirmation order
+        self.by_label = {}
+        # result and dict of label and TcTest
+        self.by_result = {}
+        # mould side name and dict of label and TcTest
+        self.by_side = {}
+        # mould side name and dict with numbers of tested, successful and failed thermocouples
+        self.side_counts = {}
+        # True for tested thermocouples, in history row order
+        self._tested = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.by_label)
+
+    def __iter__(self):
+        return iter(self.by_label.values())
+
+    def __contains__(self, label):
+        return label in self.by_label
+
+    def add(self, test):
+        """
+        Add a confirmed test, replacing a previous result of the same thermocouple.
+
+        :param test: TcTest instance with result set
+        :return: None
+        """
+        tc = test.tc
+        self.remove(tc.label)
+        self.by_label[tc.label] = test
+        self.by_result.setdefault(test.result, {})[tc.label] = test
+        self.by_side.setdefault(tc.mold_side, {})[tc.label] = test
+        counts = self.side_counts.setdefault(tc.mold_side, {'tested': 0, 'success': 0, 'fail': 0})
+        counts['tested'] += 1
+        if test.result in counts:
+            counts[test.result] += 1
+        index = tc.history.index
+        if index >= len(self._tested):
+            self._tested = np.concatenate([self._tested, np.zeros(index + 1 - len(self._tested), dtype=bool)])
+        self._tested[index] = True
+
+    def remove(self, label):
+        test = self.by_label.pop(label, None)
+        if test is None:
+            return
+        del self.by_result[test.result][label]
+        del self.by_side[test.tc.mold_side][label]
+        counts = self.side_counts[test.tc.mold_side]
+        counts['tested'] -= 1
+        if test.result in counts:
+            counts[test.result] -= 1
+        self._tested[test.tc.history.index] = False
+
+    def get_result(self, label):
+        """
+        :param label: thermocouple label
+        :return: test result of the thermocouple or None if it is not tested
+        """
+        test = self.by_label.get(label)
+        return test.result if test else None
+
+    def get_labels(self, result):
+        """
+        :param result: test result
+        :return: list of labels of thermocouples with the result, in confirmation order
+        """
+        return list(self.by_result.get(result, {}))
+
+    def get_side_counts(self, mold_side):
+        return dict(self.side_counts.get(mold_side, {'tested': 0, 'success': 0, 'fail': 0}))
+
+    def get_tested_mask(self, tc_count):
+        """
+        :param tc_count: number of thermocouples
+        :return: boolean array, True for tested thermocouples, in history row order
+        """
+        mask = np.zeros(tc_count, dtype=bool)
+        known = min(tc_count, len(self._tested))
+        mask[:known] = self._tested[:known]
+        return mask
+
+
+class TestLane:
+    """
+    Testing pipeline of a mould side: the test in progress and the completed test awaiting confirmation.
+    Lanes of different mould sides run independently, so crews testing different sides do not wait for each other.
+    """
+
+    def __init__(self, mold_side) -> None:
+        super().__init__()
+        self.mold_side = mold_side
+        self.current_test = None
+        self.completed_test = None
+
+    @property
+    def is_idle(self):
+        return not self.current_test and not self.completed_test
+
+
 class TestSession:
     """
     Stores information about current test session:
-    test results, test session start time, and current testing configuration.
+    test results, test lanes of mould sides, test session start time, and current testing configuration.
     """
 
     def __init__(self) -> None:
         super().__init__()
         self.started_at = datetime.now()
-        self.current_test = None
-        self.completed_test = None
-        self.test_results = []
+        # mould side name and TestLane, created with the first test of the side
+        self.lanes = {}
+        self.test_results = TestResults()
         self.direction = GuidedTestingDirection.HORIZONTAL_FIRST
+        self.detector = None
+        # mould side names of thermocouples in history row order
+        self.tc_sides = None
+        # (mould side name, direction) and tuple of labels of untested active thermocouples in testing order,
+        # removed when a test result or a status change of the side makes it outdated and rebuilt on the next request
+        self._orderings = {}
+        # (mould side name, direction) and all thermocouples of the side in testing order, never changes
+        self.side_sequences = {}
+
+    def get_lane(self, mold_side):
+        lane = self.lanes.get(mold_side)
+        if lane is None:
+            lane = self.lanes[mold_side] = TestLane(mold_side)
+        return lane
 
-    def update(self, tcs, config):
+    def update(self, tcs, history, active, config):
         """
-        Performs update on test session:
+        Performs update on test session, for every mould side lane independently:
         Checks if currently tested thermocouple is not disconnected, and if it is, stops current test.
-        If no test is currently run, it detects heated thermocouple and start a new test for it.
+        If no test is currently run on a side, it detects heated thermocouple of the side and starts a new test for it.
         Checks if current test is complete and needs to be confirmed (automatically or by user).
 
-        :param tcs: app.tcs - dictionary with TC labels as keys and thermocouple objects as values.
+        :param tcs: list of all thermocouples in history row order
+        :param history: HistoryStore with temperature history of all thermocouples
+        :param active: boolean array, True for thermocouples with status OK
         :param config: current application config
         :return: None
         """
-        if self.current_test and not self.current_test.tc.status == 'OK':
-            print(f'Autotested {self.current_test.tc.text_label} disconnected.')
-            self.current_test = None
-        if not self.current_test and not self.completed_test:
-            detection_result = self.detect_tested_tc(tcs, config.detection_time, config.detection_degrees)
-            if detection_result:
+        if config.detection_method == 'streaming':
+            # detector state has to follow every sample, even while tests are running
+            self.sync_detector(history, config)
+        for lane in self.lanes.values():
+            if lane.current_test and not lane.current_test.tc.status == 'OK':
+                print(f'Autotested {lane.current_test.tc.text_label} disconnected.')
+                lane.current_test = None
+        idle_sides = set(self.get_tc_sides(tcs).tolist())
+        for lane in self.lanes.values():
+            if not lane.is_idle:
+                idle_sides.discard(lane.mold_side)
+        for lane in list(self.lanes.values()):
+            if lane.current_test:
+                self.update_lane_test(lane, tcs, config)
+        if idle_sides:
+            for detection_result in self.detect_tested_tcs(tcs, history, active, config, idle_sides):
                 print('Detected!')
                 tc = detection_result['tc']
                 test_data = detection_result['test_data']
                 self.new_tc_test(tc, test_data, manual=False)
-        elif self.current_test:
-            self.current_test.update(config.test_time, config.test_degrees)
-            if self.current_test.is_complete:
-                print(f'Test marked as completed. {self.current_test.tc.text_label}')
-                self.completed_test = self.current_test
-
-                map = {
-                    'time out': 'fail',
-                    'complete': 'success',
-                }
-                result = map[self.current_test.result]
-                # instantly confirm manual test
-                if self.current_test.is_manual:
-                    self.confirm_test(result)
-                # instantly confirm successful tests if they are with correct ordering
-                elif result == 'success':
-                    mold_side = self.current_test.tc.mold_side
-                    mold_side_tcs = [tc for tc in tcs.values() if tc.mold_side == mold_side]
-                    ordering = self.get_ordering(mold_side_tcs)
-                    expected_tc_label = ordering[0]
-                    if self.current_test.tc.label == expected_tc_label:
-                        self.confirm_test(result)
-
-                self.current_test = None
-
-    def detect_tested_tc(self, tcs, time_threshold, temperature_threshold):
-        """
-        Method for detecting heated thermocouple.
-
-        :param tcs: list of all thermocouples
-        :param time_threshold: time within which the temperature
-        change must happen for thermocouple to be considered heated
-        :param temperature_threshold: amount of degrees temperature
-        must rise within time limit for the thermocouple to be considered as heated
-        :return: detection info (heated tc and information for creating a new TcTest) as a dict or None
-        """
-        already_tested = list(test.tc for test in self.test_results)
-        active_tcs = list(filter(lambda tc: tc.status == 'OK', tcs.values()))
-        if active_tcs:
-            first_tc = active_tcs[0]
-            bound_index = first_tc.find_threshold_index(time_threshold)
-            if bound_index:
-                for tc in active_tcs:
-                    test_info = tc.get_test_status(bound_index, temperature_threshold)
-                    is_tested = test_info['is_tested']
-                    if is_tested and tc not in already_tested:
-                        print(test_info['data'])
-                        return {
-                            'tc': tc,
-                            'test_data': test_info['data']
-                        }
-        return None
+
+    def update_lane_test(self, lane, tcs, config):
+        """
+        Check if the current test of a lane is complete and confirm it if it needs no confirmation by user.
+
+        :param lane: TestLane with a current test
+        :param tcs: list of all thermocouples in history row order
+        :param config: current application config
+        :return: None
+        """
+        lane.current_test.update(config.test_time, config.test_degrees)
+        if lane.current_test.is_complete:
+            print(f'Test marked as completed. {lane.current_test.tc.text_label}')
+            lane.completed_test = lane.current_test
+
+            map = {
+                'time out': 'fail',
+                'complete': 'success',
+            }
+            result = map[lane.current_test.result]
+            # instantly confirm manual test
+            if lane.current_test.is_manual:
+                self.confirm_test(result, lane.mold_side)
+            # instantly confirm successful tests if they are with correct ordering
+            elif result == 'success':
+                mold_side_tcs = [tc for tc in tcs if tc.mold_side == lane.mold_side]
+                ordering = self.get_ordering(mold_side_tcs)
+                expected_tc_label = ordering[0]
+                if lane.current_test.tc.label == expected_tc_label:
+                    self.confirm_test(result, lane.mold_side)
+
+            lane.current_test = None
+
+    def get_tc_sides(self, tcs):
+        """
+        :param tcs: list of all thermocouples in history row order
+        :return: array of mould side names of the thermocouples
+        """
+        if self.tc_sides is None or len(self.tc_sides) != len(tcs):
+            self.tc_sides = np.array([tc.mold_side for tc in tcs], dtype=object)
+        return self.tc_sides
+
+    def detect_tested_tcs(self, tcs, history, active, config, mold_sides):
+        """
+        Method for detecting heated thermocouples, at most one per mould side.
+        Depending on config.detection_method, either the streaming detector state is used,
+        or the temperature rise over the detection window is checked on the history matrix.
+        All mould sides are checked at once, so idle lanes share one detection pass.
+
+        :param tcs: list of all thermocouples in history row order
+        :param history: HistoryStore with temperature history of all thermocouples
+        :param active: boolean array, True for thermocouples with status OK
+        :param config: current application config, provides detection time - time within which the temperature
+        change must happen, and detection degrees - amount of degrees temperature must rise within time limit
+        for the thermocouple to be considered as heated
+        :param mold_sides: names of mould sides without a running test
+        :return: list of detection info (heated tc and information for creating a new TcTest) as dicts
+        """
+        candidates = (active & ~self.test_results.get_tested_mask(len(tcs))
+                      & np.isin(self.get_tc_sides(tcs), list(mold_sides)))
+        if config.detection_method == 'streaming':
+            heated = self.detector.find_heated(candidates)
+            init_times = self.detector.min_times
+        else:
+            bound_index, heated = find_heated_tcs(history, candidates, config.detection_time,
+                                                  config.detection_degrees)
+            init_times = np.full(len(tcs), history.times[bound_index]) if len(heated) else None
+        detections = {}
+        for index in heated.tolist():
+            tc = tcs[index]
+            # on every side the thermocouple with the highest temperature rise is considered heated
+            if tc.mold_side in detections:
+                continue
+            test_data = {
+                'init_time': float(init_times[index]),
+                'start_time': float(history.times[-1]),
+                # rounding removes float32 representation noise
+                'start_temperature': round(float(history.temperatures[index, -1]), 2),
+            }
+            print(test_data)
+            detections[tc.mold_side] = {
+                'tc': tc,
+                'test_data': test_data
+            }
+        return list(detections.values())
+
+    def sync_detector(self, history, config):
+        """
+        Feed samples appended to history since the last call to the streaming detector.
+        The detector is rebuilt from the history if detection time or degrees have changed.
+
+        :param history: HistoryStore with temperature history of all thermocouples
+        :param config: current application config
+        :return: None
+        """
+        detector = self.detector
+        if detector is None or not detector.is_configured_for(config):
+            detector = StreamingRiseDetector(history.tc_count, config.detection_time, config.detection_degrees)
+            # only samples within the detection window are needed to restore the state
+            if len(history):
+                window_start = history.times[-1] - detector.detection_seconds
+                detector.count = history.count - len(history) + int(np.searchsorted(history.times, window_start))
+            else:
+                detector.count = history.count
+            self.detector = detector
+        detector.update(history)
 
     def new_tc_test(self, tc, test_data, manual):
-        self.current_test = TcTest(tc, test_data, manual)
+        self.get_lane(tc.mold_side).current_test = TcTest(tc, test_data, manual)
 
-    def confirm_test(self, result):
+    def confirm_test(self, result, mold_side=None):
         """
-        Add completed test to test_results with passed result.
+        Add completed test of a lane to test_results with passed result.
 
         :param result: test result
+        :param mold_side: mould side of the lane, can be omitted while only one lane has a completed test
+        :return: True if a test was confirmed, False if there is no completed test to confirm
+        """
+        if mold_side is None:
+            waiting = [lane for lane in self.lanes.values() if lane.completed_test]
+            lane = waiting[0] if len(waiting) == 1 else None
+        else:
+            lane = self.lanes.get(mold_side)
+        if lane is None or lane.completed_test is None:
+            return False
+        lane.completed_test.result = result
+        self.test_results.add(lane.completed_test)
+        self.statuses_changed([lane.completed_test.tc.mold_side])
+        lane.completed_test = None
+        return True
+
+    def statuses_changed(self, mold_sides):
+        """
+        Drop orderings of mould sides where a thermocouple got connected, disconnected or tested.
+
+        :param mold_sides: names of mould sides with changed thermocouple statuses
         :return: None
         """
-        self.completed_test.result = result
-        self.test_results.append(self.completed_test)
-        self.completed_test = None
+        for mold_side in mold_sides:
+            for direction in GuidedTestingDirection:
+                self._orderings.pop((mold_side, direction), None)
 
     def set_guided_testing_direction(self, direction):
         """
@@ -127,21 +440,35 @@ class TestSession:
     def get_ordering(self, mold_side_tcs):
         """
         Get thermocouple ordering for expected testing according to currently selected guided testing direction.
+        The ordering is kept between calls and only rebuilt after a test result or a status change on the mould side.
 
         :param mold_side_tcs: thermocouples on the mould side for which the ordering is required
-        :return: list of tc labels, ordered according to selected direction
+        :return: tuple of tc labels, ordered according to selected direction
         """
-        active_tcs = set(tc for tc in mold_side_tcs if tc.status == "OK")
-        tested_tcs = set(result.tc for result in self.test_results)
+        if not mold_side_tcs:
+            return ()
+        key = (mold_side_tcs[0].mold_side, self.direction)
+        ordering = self._orderings.get(key)
+        if ordering is None:
+            sequence = self.side_sequences.get(key)
+            if sequence is None:
+                sequence = self.side_sequences[key] = self.get_testing_sequence(mold_side_tcs, self.direction)
+            ordering = tuple(tc.label for tc in sequence if tc.status == "OK" and tc.label not in self.test_results)
+            self._orderings[key] = ordering
+        return ordering
 
-        if self.direction == GuidedTestingDirection.VERTICAL_FIRST:
-            tcs = sorted(sorted([tc for tc in active_tcs - tested_tcs], key=lambda tc: tc.y, reverse=True),
-                         key=lambda tc: tc.x)
-        elif self.direction == GuidedTestingDirection.HORIZONTAL_FIRST:
-            tcs = sorted([tc for tc in active_tcs - tested_tcs], key=lambda tc: tc.label)
-        else:
-            tcs = []
-        return [tc.label for tc in tcs]
+    @staticmethod
+    def get_testing_sequence(mold_side_tcs, direction):
+        """
+        :param mold_side_tcs: thermocouples on the mould side
+        :param direction: guided testing direction
+        :return: list of all thermocouples of the mould side, ordered according to the direction
+        """
+        if direction == GuidedTestingDirection.VERTICAL_FIRST:
+            return sorted(sorted(mold_side_tcs, key=lambda tc: tc.y, reverse=True), key=lambda tc: tc.x)
+        elif direction == GuidedTestingDirection.HORIZONTAL_FIRST:
+            return sorted(mold_side_tcs, key=lambda tc: tc.label)
+        return []
 
 
 class TcTest:
@@ -149,7 +476,7 @@ class TcTest:
     Thermocouple test class
     Each thermocouple test stores the following information:
     thermocouple, for which the test is initiated
-    time and temperature at the beginning of a test
+    time (as POSIX timestamp) and temperature at the beginning of a test
     boolean value, defining whether a test is run in manual mode or not
     boolean completion status
     test result
@@ -187,8 +514,8 @@ class TcTest:
     def to_dict(self):
         tc_dict = self.tc.to_dict()
         tc_dict.update({
-            'init_time': self.init_time,
-            'start_time': self.start_time,
+            'init_time': datetime.fromtimestamp(self.init_time).isoformat(),
+            'start_time': datetime.fromtimestamp(self.start_time).isoformat(),
             'start_temperature': self.start_temperature,
             'is_complete': self.is_complete,
             'result': self.result,
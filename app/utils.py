@@ -1,15 +1,45 @@
+import os
+
+from archive import SessionArchive
 from config import MSDConfig
+from disk_history import DiskHistoryStore
 from emulator import Emulator
-from mold_config import MouldConfig, tcs_from_config
-from testing import TestSession
+from live_updates import LiveUpdateHub, live_updates_key
+from mold_config import MouldConfig
+from report_jobs import ReportJobs
+from station import MouldStation
 # from wlanboxconnector import WLANBoxConnector
 
+# plant mould configurations hosted by this server,
+# if empty, only the mould from the common config is hosted
+mould_configs = []
+
+# long-term history is stored in a subdirectory per mould, None disables it
+history_directory = os.path.join('data', 'history')
+# one segment holds an hour of records at 0.2 s update interval
+history_segment_records = 18000
+# number of segments kept on disk, older segments are removed
+history_max_segments = 24
+# finished test sessions of all moulds
+archive_path = os.path.join('data', 'archive.sqlite3')
+
 
 def init_app(app):
-    app.mold_config = MouldConfig.from_common_config()
-    app.tcs = tcs_from_config(app.mold_config)
-    app.wlanbox = Emulator(app.mold_config.tc_count)
-    # app.wlanbox = WLANBoxConnector(app.mold_config.tc_count)
     app.msd_config = MSDConfig()
-    app.test_session = TestSession()
+    app.stations = {}
+    app[live_updates_key] = set()
+    app.report_jobs = ReportJobs()
+    app.archive = SessionArchive(archive_path)
+    for mould_config in mould_configs or [None]:
+        mold_config = MouldConfig.from_common_config(mould_config)
+        wlanbox = Emulator(mold_config.tc_count)
+        # wlanbox = WLANBoxConnector(mold_config.tc_count, mould_config)
+        disk_history = None
+        if history_directory:
+            disk_history = DiskHistoryStore(os.path.join(history_directory, mold_config.mold_no),
+                                            sum(len(side.labels) for side in mold_config.mold_sides),
+                                            history_segment_records, history_max_segments)
+        station = MouldStation(mold_config, wlanbox, disk_history)
+        station.live_updates = LiveUpdateHub(station)
+        app.stations[station.id] = station
     return app
@@ -1,34 +1,164 @@
+import asyncio
 import datetime
 import json
+import os
+from time import time
 
 import aiohttp_jinja2
 from aiohttp import web
 
+from archive import archive_page_size
+from background_tasks import update_interval_seconds
 from breadcrumb import get_breadcrumb_data
 from config import MSDConfig
-from reporter import generate_report
+from disk_history import parse_time
+from downsampling import minmax_downsample
+from exports import export_chunk_records, history_csv_chunks, history_binary_chunks, tests_csv_chunks, stream_export
+from history import to_isoformat, to_json_list
+from report_jobs import report_path
+from reporter import build_report_data
+from responses import json_response, snapshot_response
+from snapshots import get_side_snapshot, get_side_geometry
+from station import get_station
 from testing import TestSession
 
 
+def read_tc_range(station, index, time_from, time_to, points):
+    """
+    Read history of a thermocouple between two moments.
+    If the range holds more raw samples than points, it is served from the finest rollup resolution that fits,
+    otherwise from the long-term history on disk, downsampled to points.
+
+    :param station: MouldStation instance
+    :param index: thermocouple row index
+    :param time_from: POSIX timestamp, start of the range, from the oldest sample if None
+    :param time_to: POSIX timestamp, end of the range, up to now if None
+    :param points: maximum number of points or None for all raw samples
+    :return: tuple of times array, temperatures array and dict with additional response fields
+    """
+    if time_from is None:
+        time_from = (station.disk_history.oldest_time if station.disk_history
+                     else station.rollups.levels[-1].oldest_time)
+    if time_to is None:
+        time_to = time()
+    if points and time_from is not None and (time_to - time_from) / update_interval_seconds > points:
+        level = station.rollups.find_level(time_from, time_to, points)
+        if level:
+            times, stats = level.read_range(time_from, time_to, index)
+            return times, stats['mean'], {
+                'min': to_json_list(stats['min']),
+                'max': to_json_list(stats['max']),
+                'resolution': level.resolution,
+            }
+    if not station.disk_history:
+        raise web.HTTPBadRequest(text='Long-term history is disabled.')
+    times, temperatures = station.disk_history.read_range(time_from, time_to, index)
+    if points:
+        times, temperatures = minmax_downsample(times, temperatures, points)
+    return times, temperatures, {}
+
+
 async def get_tc_data(request):
-    tc = request.app.tcs[int(request.query['tc'])]
-    hist_list = list(tc.history)
-    result = {
-        'time': [record['time'] for record in hist_list],
-        'temperature': [record['temperature'] for record in hist_list],
+    station = get_station(request)
+    tc = station.tcs[int(request.query['tc'])]
+    points = None
+    if 'points' in request.query:
+        # the client asks for no more points than it can draw
+        try:
+            points = int(request.query['points'])
+        except ValueError:
+            points = 0
+        if points < 2:
+            raise web.HTTPBadRequest(text='points must be an integer greater than 1.')
+    extra = {}
+    if 'from' in request.query or 'to' in request.query:
+        if 'since' in request.query:
+            raise web.HTTPBadRequest(text='since cannot be combined with from and to.')
+        try:
+            time_from = parse_time(request.query.get('from'))
+            time_to = parse_time(request.query.get('to'))
+        except ValueError:
+            raise web.HTTPBadRequest(text='from and to must be POSIX timestamps or ISO format times.')
+        times, temperatures, extra = read_tc_range(station, tc.history.index, time_from, time_to, points)
+    else:
+        since = None
+        if 'since' in request.query:
+            try:
+                since = int(request.query['since'])
+            except ValueError:
+                raise web.HTTPBadRequest(text='since must be a cursor returned by a previous response.')
+        times, temperatures, extra = read_tc_window(tc, since)
+        if points:
+            times, temperatures = minmax_downsample(times, temperatures, points)
+    return json_response(build_tc_data(tc, times, temperatures, extra))
+
+
+def read_tc_window(tc, since=None):
+    """
+    Read the current window of a thermocouple history or only the samples appended after a cursor.
+    The client passes the cursor of its previous response to receive only newer samples.
+
+    :param tc: Thermocouple instance
+    :param since: cursor of a previous response or None for the whole window
+    :return: tuple of times array, temperatures array and dict with the new cursor
+    (and with 'reset' and 'capacity' if since is given)
+    """
+    history = tc.history.store
+    times, temperatures = tc.history.times, tc.history.temperatures
+    extra = {'cursor': history.count}
+    if since is not None:
+        start = history.find_cursor_index(since)
+        # if the cursor has fallen out of the buffer, the whole window is sent again
+        extra['reset'] = start is None
+        extra['capacity'] = history.capacity
+        if start is not None:
+            times, temperatures = times[start:], temperatures[start:]
+    return times, temperatures, extra
+
+
+def build_tc_data(tc, times, temperatures, extra=None):
+    """
+    Build temperature history data of a thermocouple.
+
+    :param tc: Thermocouple instance
+    :param times: array of sample times
+    :param temperatures: array of temperatures
+    :param extra: dict with additional fields
+    :return: dict that can be serialized to JSON
+    """
+    return {
+        'time': to_isoformat(times),
+        'temperature': to_json_list(temperatures),
         'name': tc.text_label,
+        **(extra or {}),
     }
-    return web.Response(text=json.dumps(result))
 
 
 @aiohttp_jinja2.template('start.html')
 async def get_start_page(request):
-    return {}
+    return {
+        'mold_no': get_station(request).id,
+    }
 
 
 @aiohttp_jinja2.template('reports.html')
 async def get_reports_page(request):
-    return {}
+    """Archived test sessions, newest first, filtered by ?mould=, ?tester= and ?date= and paged by ?page=."""
+    filters = {key: request.query.get(key, '').strip() for key in ('mould', 'tester', 'date')}
+    try:
+        page = max(int(request.query.get('page', 1)), 1)
+        date = datetime.date.fromisoformat(filters['date']) if filters['date'] else None
+    except ValueError:
+        raise web.HTTPBadRequest(text='page must be a number and date must be in YYYY-MM-DD format.')
+    sessions, total = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: request.app.archive.list_sessions(filters['mould'], filters['tester'], date, page))
+    return {
+        'sessions': sessions,
+        'filters': filters,
+        'page': page,
+        'pages': max((total + archive_page_size - 1) // archive_page_size, 1),
+        'total': total,
+    }
 
 
 @aiohttp_jinja2.template('test-mould.html')
@@ -37,7 +167,7 @@ async def get_mold_side_selection_page(request):
     breadcrumb.append('Mold Side Selection')
     return {
         'breadcrumb': breadcrumb,
-        'mold_no': request.app.mold_config.mold_no
+        'mold_no': get_station(request).id
     }
 
 
@@ -46,8 +176,9 @@ async def get_test_page(request):
     mold_side = request.query['mold_side']
     breadcrumb = get_breadcrumb_data(request)
     breadcrumb.append(mold_side)
+    station = get_station(request)
     selected_tc = next(
-        tc for tc in request.app.tcs.values() if str(tc.mold_side).lower() == str(mold_side).lower()).label
+        tc for tc in station.tcs.values() if str(tc.mold_side).lower() == str(mold_side).lower()).label
     return {
         'mold_side': mold_side,
         'selected_tc': selected_tc,
@@ -55,6 +186,7 @@ async def get_test_page(request):
         'heatmap_info': json.dumps({
             'graphTitle': mold_side + " Side",
             'moldSide': mold_side,
+            'geometryVersion': station.geometry_version.hex(),
         }),
         'min_temperature': request.app.msd_config.min_graph_temperature,
         'max_temperature': request.app.msd_config.max_graph_temperature,
@@ -62,47 +194,61 @@ async def get_test_page(request):
 
 
 async def get_new_test_session(request):
-    request.app.test_session = TestSession()
-    print(datetime.datetime.now(), ': Test restarted.')
-    raise web.HTTPFound('/test-mould')
+    station = get_station(request)
+    test_session = station.test_session
+    if len(test_session.test_results):
+        # report data reads the live thermocouple statuses, so it is collected before the session is replaced
+        report_data = build_report_data(station)
+        session_id = await asyncio.get_running_loop().run_in_executor(
+            None, request.app.archive.save_session, station, test_session, request.app.msd_config, report_data)
+        print(datetime.datetime.now(), f': Test session of mould {station.id} archived as {session_id}.')
+    station.test_session = TestSession()
+    station.state_changed()
+    print(datetime.datetime.now(), f': Test restarted on mould {station.id}.')
+    raise web.HTTPFound(request.path.replace('/new-test', '/test-mould'))
 
 
-async def get_session_info(request):
-    app = request.app
+def get_mold_side(request, station):
+    """
+    :param request: request instance with mold_side query parameter
+    :param station: MouldStation instance
+    :return: name of the requested mould side
+    :raises web.HTTPNotFound: if the mould has no such side
+    """
     mold_side = request.query['mold_side']
-    mold_side_tcs = [tc for tc in app.tcs.values() if tc.mold_side == mold_side]
-    test_session = app.test_session
-    ordering = test_session.get_ordering(mold_side_tcs)
-    completed_info = test_session.completed_test.to_dict() if test_session.completed_test else None
-    current_direction = test_session.direction.name.lower()
-    if test_session.current_test and test_session.current_test.is_manual:
-        current_direction = 'manual'
-    return web.Response(text=json.dumps({
-        'completed': completed_info,
-        'ordering': ordering,
-        'current_mode': current_direction,
-    }))
+    if mold_side not in [side.name for side in station.mold_config.mold_sides]:
+        raise web.HTTPNotFound(text=f'Mould {station.id} has no {mold_side} side.')
+    return mold_side
+
+
+async def get_session_info(request):
+    station = get_station(request)
+    return snapshot_response(request, get_side_snapshot(station, get_mold_side(request, station)).session)
 
 
 async def post_test_direction(request):
     if request.body_exists:
         params = await request.post()
         direction = params['direction']
-        request.app.test_session.set_guided_testing_direction(direction)
+        station = get_station(request)
+        station.test_session.set_guided_testing_direction(direction)
+        station.state_changed()
         print('Test direction changed to', direction)
     return web.Response()
 
 
 @aiohttp_jinja2.template('settings.html')
 async def get_autotest_config(request):
-    mould_name = request.app.mold_config.name
+    station = get_station(request)
+    mould_name = station.mold_config.name
     config = request.app.msd_config
     result = {
         'detection_time': config.detection_time.seconds,
         'detection_degrees': config.detection_degrees,
+        'detection_method': config.detection_method,
         'test_time': config.test_time.seconds,
         'test_degrees': config.test_degrees,
-        'test_session_start_time': request.app.test_session.started_at.isoformat(),
+        'test_session_start_time': station.test_session.started_at.isoformat(),
         'mold_layout': mould_name,
         'tester_name': request.app.msd_config.tester_name,
         'min_graph_temperature': request.app.msd_config.min_graph_temperature,
@@ -118,84 +264,70 @@ async def post_autotest_config(request):
         print('Config updated.')
         # request.app.test_session = TestSession()
         # print('Test session restarted.')
-        raise web.HTTPFound('/settings')
+        raise web.HTTPFound(request.path)
     return {}
 
 
 async def get_heatmap_update(request):
-    request_mold_side = request.query['mold_side']
-    app = request.app
-    slave_state = app.mold_side_states[request_mold_side]
-    if slave_state != 'No error':
-        errors = slave_state
-        heatmap_data = {}
-    else:
-        errors = None
-        mold_side_tcs = [tc for tc in app.tcs.values() if tc.mold_side == request_mold_side]
-        test_session = app.test_session
-        test_results = test_session.test_results
-        statuses = [tc.status for tc in mold_side_tcs]
-        successful_tests = [test.tc.label for test in test_results if test.result == "success"]
-        failed_tests = [test.tc.label for test in test_results if test.result == "fail"]
-        if test_session.completed_test:
-            current_test = test_session.completed_test.tc.label
-        elif test_session.current_test:
-            current_test = test_session.current_test.tc.label
-        else:
-            current_test = None
-        heatmap_data = {
-            'x': [tc.x for tc in mold_side_tcs],
-            'y': [tc.y for tc in mold_side_tcs],
-            'temperature': [tc.temperature for tc in mold_side_tcs],
-            'label': [tc.label for tc in mold_side_tcs],
-            'status': statuses,
-            'test': {
-                'successful': successful_tests,
-                'failed': failed_tests,
-                'current': current_test,
-            }
-        }
-    result = {
-        'error': errors,
-        'data': heatmap_data,
-    }
-    text = json.dumps(result)
-    return web.Response(text=text)
+    station = get_station(request)
+    return snapshot_response(request, get_side_snapshot(station, get_mold_side(request, station)).heatmap)
+
+
+async def get_heatmap_frame(request):
+    station = get_station(request)
+    return snapshot_response(request, get_side_snapshot(station, get_mold_side(request, station)).frame)
+
+
+async def get_heatmap_geometry(request):
+    station = get_station(request)
+    mold_side = get_mold_side(request, station)
+    cache_control = 'no-cache'
+    if request.query.get('v') == station.geometry_version.hex():
+        # versioned URL, its content never changes
+        cache_control = 'public, max-age=31536000, immutable'
+    return snapshot_response(request, get_side_geometry(station, mold_side), cache_control)
 
 
 async def autotest_confirmation(request):
-    test_session = request.app.test_session
+    station = get_station(request)
     print("Test result received!")
+    result = {'msg': 'autotest confirmed', }
     if request.body_exists:
         body = json.loads(await request.read())
         print(body)
-        test_session.confirm_test(body['result'])
-    return web.Response(text=json.dumps({'msg': 'autotest confirmed', }))
+        # every mould side has its own test lane, older clients do not name the side
+        if station.test_session.confirm_test(body['result'], body.get('mold_side')):
+            station.state_changed()
+        else:
+            result = {'msg': 'No completed test awaits confirmation.', }
+    return json_response(result)
 
 
 async def post_manual_test(request):
-    test_session = request.app.test_session
-    if test_session.current_test:
-        result = {
-            'msg': "You can't start new manual test during another test."
-        }
-    elif request.body_exists:
+    station = get_station(request)
+    test_session = station.test_session
+    if request.body_exists:
         params = await request.post()
         tc_num = int(params['tc'])
-        tc = request.app.tcs[tc_num]
-        already_tested_tcs = [result.tc for result in test_session.test_results]
-        if tc in already_tested_tcs:
+        tc = station.tcs[tc_num]
+        if test_session.get_lane(tc.mold_side).current_test:
+            result = {
+                'msg': "You can't start new manual test during another test."
+            }
+        elif tc.label in test_session.test_results:
             result = {
                 'msg': "This TC is already tested."
             }
         else:
             if tc.status == 'OK':
+                current_time = float(tc.history.times[-1])
                 test_data = {
-                    'init_time': tc.history[-1]['time'],
-                    'start_time': tc.history[-1]['time'],
-                    'start_temperature': tc.history[-1]['temperature'],
+                    'init_time': current_time,
+                    'start_time': current_time,
+                    'start_temperature': round(float(tc.history.temperatures[-1]), 2),
                 }
                 test_session.new_tc_test(tc, test_data, manual=True)
+                station.state_changed()
                 result = {
                     'msg': "OK"
                 }
@@ -207,36 +339,172 @@ async def post_manual_test(request):
         result = {
             'msg': "Please, specify TC num."
         }
-    text = json.dumps(result)
-    return web.Response(text=text)
+    return json_response(result)
 
 
-async def get_report(request):
-    app = request.app
-    data = {}
-    for mold_side in [mold_side.name for mold_side in app.mold_config.mold_sides]:
-        mold_side_tcs = [tc for tc in app.tcs.values() if tc.mold_side == mold_side]
-        test_session = app.test_session
-        test_results = test_session.test_results
-        successful_tests = [test.tc.label for test in test_results if test.result == "success"]
-        failed_tests = [test.tc.label for test in test_results if test.result == "fail"]
-        statuses = []
-        for tc in mold_side_tcs:
-            if tc.label in successful_tests:
-                statuses.append("success")
-            elif tc.label in failed_tests:
-                statuses.append("fail")
-            else:
-                statuses.append(tc.status)
-        data[mold_side] = {
-            'x': [tc.x for tc in mold_side_tcs],
-            'y': [tc.y for tc in mold_side_tcs],
-            'label': [tc.label for tc in mold_side_tcs],
-            'status': statuses,
-        }
-    filename = "report"
+def submit_report(request):
+    """
+    Submit a report job for the current test session of the mould station of a request.
+
+    :param request: request instance
+    :return: ReportJob instance
+    """
+    station = get_station(request)
+    data = build_report_data(station)
+    filename = f"report_{station.id}_{datetime.datetime.now():%Y%m%d_%H%M%S}.pdf"
     tester_name = request.app.msd_config.tester_name
-    mold_type = request.app.mold_config.name
-    mold_no = request.app.mold_config.mold_no
-    generate_report(filename, data, mold_no, mold_type, tester_name)
-    return web.FileResponse(f"static/reports/{filename}.pdf")
+    mold_type = station.mold_config.name
+    mold_no = station.id
+    return request.app.report_jobs.submit(station.id, filename, data, mold_no, mold_type, tester_name)
+
+
+def get_report_job(request):
+    job = request.app.report_jobs.get(request.match_info['job_id'])
+    if job is None:
+        raise web.HTTPNotFound(text='Unknown report job.')
+    return job
+
+
+def report_job_info(request, job):
+    info = job.to_dict()
+    prefix = request.path[:request.path.index('/reports')]
+    info['status_url'] = f'{prefix}/reports/{job.id}'
+    info['download_url'] = f'{prefix}/reports/{job.id}/pdf' if job.status == 'done' else None
+    return info
+
+
+async def get_report(request):
+    """Renders a report of the current test session and redirects to its download once it is done."""
+    report_jobs = request.app.report_jobs
+    job = submit_report(request)
+    # the page waits, the event loop does not: rendering runs in a worker process
+    await report_jobs.wait(job)
+    if job.status != 'done':
+        raise web.HTTPInternalServerError(text=f'Report generation failed: {job.error}')
+    raise web.HTTPFound(request.path[:-len('/report')] + f'/reports/{job.id}/pdf')
+
+
+async def post_report_job(request):
+    job = submit_report(request)
+    return json_response(report_job_info(request, job), status=202)
+
+
+async def get_report_job_status(request):
+    """Report job status, with ?wait=<seconds> the response is delayed until the job is finished or time is up."""
+    job = get_report_job(request)
+    if job.status == 'pending' and 'wait' in request.query:
+        try:
+            timeout = min(float(request.query['wait']), 60)
+        except ValueError:
+            raise web.HTTPBadRequest(text='wait must be a number of seconds.')
+        await request.app.report_jobs.wait(job, timeout)
+    return json_response(report_job_info(request, job))
+
+
+async def get_report_job_pdf(request):
+    job = get_report_job(request)
+    if job.status != 'done':
+        raise web.HTTPConflict(text=f'Report is {job.status}.')
+    return web.FileResponse(job.path, headers={
+        'Content-Type': 'application/pdf',
+        'Content-Disposition': f'inline; filename="{job.filename}"',
+        # the file is content-addressed, so it never changes
+        'Cache-Control': 'private, max-age=31536000, immutable',
+    })
+
+
+async def get_archived_session(request, session_id):
+    """
+    Read an archived test session without blocking the event loop.
+
+    :param request: request instance
+    :param session_id: session id as passed in the request
+    :return: dict as returned by SessionArchive.get_session
+    """
+    try:
+        session_id = int(session_id)
+    except ValueError:
+        raise web.HTTPNotFound(text='Unknown archived session.')
+    session = await asyncio.get_running_loop().run_in_executor(None, request.app.archive.get_session, session_id)
+    if session is None:
+        raise web.HTTPNotFound(text='Unknown archived session.')
+    return session
+
+
+async def get_archived_report(request):
+    """
+    PDF report of an archived test session.
+    It is rendered from the archived data on the first request and served from the stored file afterwards.
+    """
+    session = await get_archived_session(request, request.match_info['session_id'])
+    started_at = datetime.datetime.fromisoformat(session['started_at'])
+    filename = f"report_{session['mould_id']}_{started_at:%Y%m%d_%H%M%S}.pdf"
+    path = report_path(session['report_digest']) if session['report_digest'] else None
+    if path is None or not os.path.exists(path):
+        job = request.app.report_jobs.submit(session['mould_id'], filename, session['report_data'],
+                                             session['mould_id'], session['mould_name'], session['tester_name'])
+        await request.app.report_jobs.wait(job)
+        if job.status != 'done':
+            raise web.HTTPInternalServerError(text=f'Report generation failed: {job.error}')
+        await asyncio.get_running_loop().run_in_executor(
+            None, request.app.archive.set_report_digest, session['id'], job.digest)
+        path = job.path
+    return web.FileResponse(path, headers={
+        'Content-Type': 'application/pdf',
+        'Content-Disposition': f'inline; filename="{filename}"',
+        'Cache-Control': 'private, max-age=31536000, immutable',
+    })
+
+
+async def get_history_export(request):
+    """
+    Raw temperature history from the long-term history on disk as CSV (/export/history.csv)
+    or in the binary columnar format of exports.py (/export/history.bin).
+    The range is given by ?from= and ?to= or by ?session=, either 'current' or an archived session id.
+    ?tc= limits the export to a comma separated list of thermocouple labels.
+    """
+    station = get_station(request)
+    if not station.disk_history:
+        raise web.HTTPBadRequest(text='Long-term history is disabled.')
+    if 'session' in request.query:
+        if request.query['session'] == 'current':
+            time_from, time_to = station.test_session.started_at.timestamp(), None
+        else:
+            session = await get_archived_session(request, request.query['session'])
+            if session['mould_id'] != station.id:
+                raise web.HTTPNotFound(text=f"Session {session['id']} was not tested on mould {station.id}.")
+            time_from = datetime.datetime.fromisoformat(session['started_at']).timestamp()
+            time_to = datetime.datetime.fromisoformat(session['finished_at']).timestamp()
+    else:
+        try:
+            time_from = parse_time(request.query.get('from'))
+            time_to = parse_time(request.query.get('to'))
+        except ValueError:
+            raise web.HTTPBadRequest(text='from and to must be POSIX timestamps or ISO format times.')
+    tcs = station.tc_list
+    if 'tc' in request.query:
+        try:
+            tcs = [station.tcs[int(label)] for label in request.query['tc'].split(',')]
+        except (ValueError, KeyError):
+            raise web.HTTPBadRequest(text='tc must be a comma separated list of thermocouple labels.')
+    chunks = station.disk_history.iter_range(time_from, time_to, [tc.history.index for tc in tcs],
+                                             export_chunk_records)
+    filename = f"history_{station.id}_{datetime.datetime.now():%Y%m%d_%H%M%S}.{request.match_info['format']}"
+    if request.match_info['format'] == 'csv':
+        return await stream_export(request, history_csv_chunks(chunks, tcs), 'text/csv', filename)
+    return await stream_export(request, history_binary_chunks(chunks, tcs), 'application/octet-stream', filename)
+
+
+async def get_tests_export(request):
+    """Thermocouple test results as CSV, of the current test session or of an archived one with ?session=<id>."""
+    station = get_station(request)
+    if 'session' in request.query and request.query['session'] != 'current':
+        session = await get_archived_session(request, request.query['session'])
+        tests = session['test_results']
+        filename = f"tests_{session['mould_id']}_session_{session['id']}.csv"
+    else:
+        # a session has at most one test per thermocouple, the dicts are taken before streaming
+        # so the export is not affected by tests confirmed in the meantime
+        tests = [test.to_dict() for test in station.test_session.test_results]
+        filename = f"tests_{station.id}_{station.test_session.started_at:%Y%m%d_%H%M%S}.csv"
+    return await stream_export(request, tests_csv_chunks(tests), 'text/csv', filename)
@@ -2,12 +2,15 @@ import configparser
 import datetime
 import json
 import os
-from ctypes import Array, c_uint8
+from ctypes import Array, Structure, c_uint8, c_uint32
 
+import numpy as np
 import pyads
 from pyads import ADSError
 from typing import Type
 
+from connection import ConnectionSupervisor
+
 from pyCommonlySharedCode.generalFunctions import get_mould_config_dir, \
     get_plantdatadir_and_plantconfig
 
@@ -18,6 +21,19 @@ def PLCTYPE_ARR_USINT(n):
     return c_uint8 * n
 
 
+# layout of one thermocouple channel in the process image: status byte followed by little endian value
+SENSOR_CHANNEL_DTYPE = np.dtype([('status', 'u1'), ('value', '<u2')])
+
+
+class SumReadRequest(Structure):
+    """One sub-request of an ADS sum-up read (ADSIGRP_SUMUP_READ)."""
+    _fields_ = [
+        ('index_group', c_uint32),
+        ('index_offset', c_uint32),
+        ('size', c_uint32),
+    ]
+
+
 class TwinCatConfigError(Exception):
     pass
 
@@ -33,9 +49,9 @@ class TwinCatConnectionInfo:
         self.slaves_order = slaves_order
 
     @classmethod
-    def from_twincat_config(cls):
-        plant_data_db_dir, mould_config = get_plantdatadir_and_plantconfig()
-        mould_cfg_dir = get_mould_config_dir(plant_data_db_dir, mould_config)
+    def from_twincat_config(cls, mould_config=None):
+        plant_data_db_dir, default_mould_config = get_plantdatadir_and_plantconfig()
+        mould_cfg_dir = get_mould_config_dir(plant_data_db_dir, mould_config or default_mould_config)
 
         cfg_path = os.path.join(mould_cfg_dir, 'MSD', 'TwinCat_Config.ini')
         cfg = configparser.ConfigParser()
@@ -101,81 +117,220 @@ class WLANBoxConnector:
         130: 'slave, waiting for parameter'
     }
 
-    def __init__(self, thermocouples_count) -> None:
+    def __init__(self, thermocouples_count, mould_config=None) -> None:
         super().__init__()
-        self.twincat_info = TwinCatConnectionInfo.from_twincat_config()
+        self.twincat_info = TwinCatConnectionInfo.from_twincat_config(mould_config)
         self.plc = pyads.Connection(self.twincat_info.ams_net_id, pyads.PORT_SPECIALTASK1)
         self.thermocouples_count = thermocouples_count
         self.status_datatype = pyads.PLCTYPE_USINT
         self.value_datatype = pyads.PLCTYPE_UINT
         self.channel_size = 3
+        self.slaves_count = len(self.twincat_info.slaves_order)
+        self.sensor_data_size = self.thermocouples_count * self.channel_size
+        self.sum_read_request = self._get_sum_read_request()
+        self.notification_handles = []
+        self.notification_frame = None
+        self.connection = ConnectionSupervisor()
+
+    def _get_sum_read_request(self):
+        """
+        Build the request for reading slave statuses and thermocouple values with one ADS round trip.
+
+        :return: ctypes array of SumReadRequest, slave statuses first
+        """
+        twincat = self.twincat_info
+        request_type = SumReadRequest * 2
+        return request_type(
+            SumReadRequest(twincat.index_group, twincat.slave_status_offset, self.slaves_count),
+            SumReadRequest(twincat.index_group, twincat.first_offset, self.sensor_data_size),
+        )
+
+    def connect(self):
+        """Open the ADS port if it is not open yet. The connection is kept open between reads."""
+        if not self.plc.is_open:
+            self.plc.open()
+
+    def close(self):
+        self.plc.close()
+
+    def read_process_image(self):
+        """
+        Read slave statuses and thermocouple channels in a single sum-up read.
+        The connection is opened on demand and closed only if the read itself fails,
+        so it is re-established on the next call.
+
+        :return: tuple of (slave status array, sensor data array)
+        """
+        request = self.sum_read_request
+        request_count = len(request)
+        response_size = 4 * request_count + self.slaves_count + self.sensor_data_size
+        self.connect()
+        try:
+            response = self.plc.read_write(pyads.constants.ADSIGRP_SUMUP_READ, request_count,
+                                           PLCTYPE_ARR_USINT(response_size), request, type(request),
+                                           return_ctypes=True)
+        except ADSError:
+            self.close()
+            raise
+        # response starts with an error code for every sub-request, followed by the data blocks
+        err_codes = np.frombuffer(response, dtype='<u4', count=request_count)
+        for err_code in err_codes:
+            if err_code:
+                raise ADSError(int(err_code))
+        data_offset = 4 * request_count
+        slave_status_array = np.frombuffer(response, dtype='u1', count=self.slaves_count, offset=data_offset)
+        data_offset += self.slaves_count
+        sensor_data_array = np.frombuffer(response, dtype=SENSOR_CHANNEL_DTYPE, count=self.thermocouples_count,
+                                          offset=data_offset)
+        return slave_status_array, sensor_data_array
 
-    def get_sensor_data(self):
+    def get_frame(self):
         """
-        Get values and statuses returned by all thermocouples whether they are connected or not.
+        Get mould side states and values and statuses returned by all thermocouples
+        whether they are connected or not.
 
         :return:
         {
-            "time": time when measure is taken
+            "time": POSIX timestamp of the moment the measure is taken
+            "mold_side_states": {
+                "side_name": slave status meaning
+            }
             "state": {
-                "tc_label": {
-                    "status": status of a thermocouple
-                    "temperature": temperature value
-                    }
+                "status": numpy array of thermocouple statuses, indexed by tc label - 1
+                "temperature": numpy array of temperature values, NaN if status is not 0
                 }
         }
         """
-        twincat = self.twincat_info
-        try:
-            # get array
-            with self.plc as plc:
-                array = plc.read(twincat.index_group, twincat.first_offset,
-                                 PLCTYPE_ARR_USINT(self.thermocouples_count * self.channel_size))
-                # parse array
-                state = self.parse_sensor_data_array(array)
-        except ADSError as e:
-            print("Looks like you're disconnected. :(\nPlease, run TwinCAT. Error msg: ", e.msg)
-            state = {}
-        current_time = datetime.datetime.now().isoformat()
+        mold_side_states = {
+            side_name: self.slave_status_meaning[1]
+            for side_name in self.twincat_info.slaves_order
+        }
+        state = {}
+        # while backing off, the read is skipped without touching the network
+        if self.connection.can_attempt():
+            try:
+                slave_status_array, sensor_data_array = self.read_process_image()
+                mold_side_states = self.parse_slave_status_array(slave_status_array)
+                state = self.parse_sensor_data_array(sensor_data_array)
+                self.connection.record_success()
+            except ADSError as e:
+                self.connection.record_failure(e.msg)
+        current_time = datetime.datetime.now().timestamp()
         result = {'time': current_time,
+                  'mold_side_states': mold_side_states,
                   'state': state}
         return result
 
-    def parse_sensor_data_array(self, array):
-        state = {}
-        for i in [num * self.channel_size for num in range(0, self.thermocouples_count)]:
-            status = array[i]
-            # little endian :(
-            thermocouple_value = array[i + 1] + array[i + 2] * 256
-            temperature = thermocouple_value / 10
-
-            if status != 0:
-                temperature = None
-            label = i // 3 + 1
-            data = {
-                'status': status,
-                'temperature': temperature,
-            }
-            state[label] = data
-        return state
+    def parse_sensor_data_array(self, channels):
+        """
+        Decode thermocouple channels of the process image.
 
-    def get_mould_side_states(self):
+        :param channels: structured array with SENSOR_CHANNEL_DTYPE viewing the ADS read buffer
+        :return: dict with status and temperature arrays, indexed by tc label - 1
+        """
+        status = channels['status']
+        temperature = channels['value'] / 10
+        temperature[status != 0] = np.nan
+        return {
+            'status': status,
+            'temperature': temperature,
+        }
+
+    def parse_slave_status_array(self, array):
+        result = {}
+        for index, side_name in enumerate(self.twincat_info.slaves_order):
+            result[side_name] = self.slave_status_meaning[array[index]]
+        return result
+
+    def subscribe(self, callback, on_change=True, cycle_time=0.2):
+        """
+        Subscribe to ADS device notifications for slave statuses and thermocouple channels
+        instead of polling them with get_frame.
+
+        :param callback: called from the ADS router thread with a new frame in get_frame format
+        :param on_change: if True, TwinCAT sends a notification only when data changes (checked every cycle),
+        otherwise it is sent every cycle
+        :param cycle_time: cycle time in seconds
+        :return: True if subscribed, False if the subscription failed (the failure is reported to self.connection)
+        """
         twincat = self.twincat_info
-        slaves_count = len(self.twincat_info.slaves_order)
-        try:
-            with self.plc as plc:
-                array = plc.read(twincat.index_group, twincat.slave_status_offset,
-                                 PLCTYPE_ARR_USINT(slaves_count))
-            result = {}
-            for index in range(slaves_count):
-                value = array[index]
-                status = self.slave_status_meaning[value]
-                side_name = twincat.slaves_order[index]
-                result[side_name] = status
-        except ADSError as e:
-            print("Looks like you're disconnected. :(\nPlease, run TwinCAT. Error msg: ", e.msg)
-            result = {
+        trans_mode = pyads.ADSTRANS_SERVERONCHA if on_change else pyads.ADSTRANS_SERVERCYCLE
+        # NotificationAttrib expects times in ms
+        cycle_time_ms = cycle_time * 1000
+        self.notification_frame = {
+            'time': datetime.datetime.now().timestamp(),
+            'mold_side_states': {
                 side_name: self.slave_status_meaning[1]
                 for side_name in twincat.slaves_order
-            }
-        return result
+            },
+            'state': {},
+        }
+
+        def on_slave_status(notification, data_name):
+            try:
+                _, _, value = self.plc.parse_notification(notification, None)
+                mold_side_states = self.parse_slave_status_array(np.frombuffer(bytes(value), dtype='u1'))
+            except Exception as e:
+                # raising into the ADS router thread would lose the error
+                self.connection.record_failure(repr(e))
+                return
+            self._notify(callback, mold_side_states=mold_side_states)
+
+        def on_sensor_data(notification, data_name):
+            try:
+                _, _, value = self.plc.parse_notification(notification, None)
+                state = self.parse_sensor_data_array(np.frombuffer(bytes(value), dtype=SENSOR_CHANNEL_DTYPE))
+            except Exception as e:
+                self.connection.record_failure(repr(e))
+                return
+            self._notify(callback, state=state)
+
+        try:
+            self.connect()
+            for offset, size, notification_callback in [
+                (twincat.slave_status_offset, self.slaves_count, on_slave_status),
+                (twincat.first_offset, self.sensor_data_size, on_sensor_data),
+            ]:
+                attr = pyads.NotificationAttrib(size, trans_mode, cycle_time_ms, cycle_time_ms)
+                handles = self.plc.add_device_notification((twincat.index_group, offset), attr,
+                                                           notification_callback)
+                self.notification_handles.append(handles)
+        except ADSError as e:
+            self.connection.record_failure(e.msg)
+            self.unsubscribe()
+            self.close()
+            return False
+        self.connection.record_success()
+        return True
+
+    def probe(self):
+        """
+        Check that the PLC is reachable with a cheap ADS state read.
+        Used while on-change notifications are silent, as silence alone does not tell steady data from a lost link.
+
+        :return: True if the PLC answered, False otherwise (the failure is reported to self.connection)
+        """
+        try:
+            self.connect()
+            self.plc.read_state()
+        except ADSError as e:
+            self.connection.record_failure(e.msg)
+            self.close()
+            return False
+        self.connection.record_success()
+        return True
+
+    def _notify(self, callback, **changes):
+        """Merge a notification into the latest known frame and pass the new frame to the callback."""
+        # local reception time is used, so that frame times are comparable with polled frames
+        frame = dict(self.notification_frame, time=datetime.datetime.now().timestamp(), **changes)
+        self.notification_frame = frame
+        callback(frame)
+
+    def unsubscribe(self):
+        for handles in self.notification_handles:
+            try:
+                self.plc.del_device_notification(*handles)
+            except ADSError as e:
+                print('Failed to remove device notification. Error msg: ', e.msg)
+        self.notification_handles = []
@@ -0,0 +1,50 @@
+"""
+Benchmark of PDF report rendering time against the number of thermocouples of a mould.
+The first (cold) render of a process parses fonts and images, later (warm) renders reuse the report resource cache.
+
+Run from the repository root: python benchmarks/report_benchmark.py
+"""
+import os
+import sys
+import time
+
+app_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, app_directory)
+# report resources are referenced by paths relative to the app directory
+os.chdir(app_directory)
+
+import reporter  # noqa: E402
+
+mold_sides = ('Fixed', 'Loose', 'Right', 'Left')
+tc_counts = (40, 80, 160, 320)
+repeats = 5
+
+
+def make_test_data(tc_count):
+    statuses = ('success', 'fail', 'OK', 'Disconnected')
+    per_side = tc_count // len(mold_sides)
+    return {
+        mold_side: {
+            'x': [(index % 10) * 100 for index in range(per_side)],
+            'y': [(index // 10) * 100 for index in range(per_side)],
+            'label': list(range(side_index * per_side + 1, (side_index + 1) * per_side + 1)),
+            'status': [statuses[index % len(statuses)] for index in range(per_side)],
+        } for side_index, mold_side in enumerate(mold_sides)
+    }
+
+
+def render(test_data):
+    start = time.perf_counter()
+    document = reporter.generate_report(test_data, '1', 'benchmark', 'Tester')
+    return time.perf_counter() - start, len(document)
+
+
+if __name__ == '__main__':
+    print(f'{"sensors":>8} {"cold, ms":>10} {"warm, ms":>10} {"size, kB":>10}')
+    for tc_count in tc_counts:
+        test_data = make_test_data(tc_count)
+        # cold: a fresh cache, as in a new report worker process
+        reporter.report_resources = reporter.ReportResources()
+        cold, size = render(test_data)
+        warm = min(render(test_data)[0] for _ in range(repeats))
+        print(f'{tc_count:>8} {cold * 1000:>10.1f} {warm * 1000:>10.1f} {size / 1000:>10.1f}')
@@ -0,0 +1,81 @@
+"""
+Benchmark of API response serialization and compression.
+Compares the standard json module with orjson (if installed) and the size and cost of gzip and deflate
+on typical /tc-data and /heatmap-data payloads.
+
+Run from the repository root: python benchmarks/responses_benchmark.py
+"""
+import gzip
+import json
+import os
+import sys
+import time
+import timeit
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from history import to_isoformat, to_json_list  # noqa: E402
+import responses  # noqa: E402
+
+repeats = 200
+
+
+def make_tc_data(samples=500):
+    times = time.time() - np.arange(samples)[::-1] * 0.2
+    temperatures = 25 + np.cumsum(np.random.normal(0, 0.05, samples)).astype(np.float32)
+    return {
+        'time': to_isoformat(times),
+        'temperature': to_json_list(temperatures),
+        'name': 'TC 1',
+        'cursor': samples,
+    }
+
+
+def make_heatmap_data(tc_count=40):
+    labels = list(range(1, tc_count + 1))
+    return {
+        'error': None,
+        'stale': False,
+        'connection': {'state': 'connected', 'consecutive_failures': 0, 'total_failures': 0, 'reconnects': 0,
+                       'last_error': None, 'retry_in': None},
+        'data': {
+            'x': [(label % 10) * 100 for label in labels],
+            'y': [(label // 10) * 100 for label in labels],
+            'temperature': [round(25 + np.random.rand(), 2) for _ in labels],
+            'label': labels,
+            'status': ['OK'] * tc_count,
+            'test': {'successful': labels[:5], 'failed': labels[5:7], 'current': labels[7]},
+        },
+    }
+
+
+def measure(function):
+    seconds = min(timeit.repeat(function, number=repeats, repeat=3)) / repeats
+    return seconds * 1e6
+
+
+def benchmark(name, data):
+    print(f'{name}:')
+    encoders = [('json', lambda: json.dumps(data).encode())]
+    if responses.orjson is not None:
+        encoders.append(('orjson', lambda: responses.orjson.dumps(data)))
+    else:
+        print('  orjson is not installed')
+    for encoder_name, encode in encoders:
+        print(f'  {encoder_name:<8} encode {measure(encode):8.1f} us')
+
+    body = responses.dumps(data)
+    print(f'  {"raw":<8} {len(body):7d} B')
+    for compression_name, compress in (
+            ('gzip', lambda: gzip.compress(body, responses.compress_level)),
+            ('deflate', lambda: zlib.compress(body, responses.compress_level))):
+        size = len(compress())
+        print(f'  {compression_name:<8} {size:7d} B ({size / len(body):.0%}), {measure(compress):8.1f} us')
+
+
+if __name__ == '__main__':
+    benchmark('/tc-data', make_tc_data())
+    benchmark('/heatmap-data', make_heatmap_data())
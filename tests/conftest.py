@@ -0,0 +1,5 @@
+import os
+import sys
+
+# application modules are imported by bare name, the server runs from the app directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'app'))
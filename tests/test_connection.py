@@ -0,0 +1,66 @@
+import connection
+from connection import ConnectionState, ConnectionSupervisor
+
+
+def fail(supervisor, times):
+    for _ in range(times):
+        supervisor.record_failure('timeout')
+
+
+def test_failures_below_threshold_degrade_the_connection():
+    supervisor = ConnectionSupervisor(failures_before_backoff=3)
+    fail(supervisor, 2)
+    assert supervisor.state == ConnectionState.DEGRADED
+    assert supervisor.retry_at is None
+    assert supervisor.can_attempt()
+    assert supervisor.last_error == 'timeout'
+
+
+def test_threshold_starts_backing_off(monkeypatch):
+    monkeypatch.setattr(connection, 'monotonic', lambda: 100.0)
+    supervisor = ConnectionSupervisor(failures_before_backoff=3, initial_delay=0.5, jitter=0)
+    fail(supervisor, 3)
+    assert supervisor.state == ConnectionState.BACKING_OFF
+    assert supervisor.retry_at == 100.5
+    assert not supervisor.can_attempt()
+    monkeypatch.setattr(connection, 'monotonic', lambda: 100.5)
+    assert supervisor.can_attempt()
+    assert supervisor.to_dict()['retry_in'] == 0.0
+
+
+def test_delay_grows_exponentially_up_to_max_delay():
+    supervisor = ConnectionSupervisor(failures_before_backoff=3, initial_delay=0.5, max_delay=5.0, multiplier=2,
+                                      jitter=0)
+    delays = []
+    for _ in range(8):
+        supervisor.record_failure('timeout')
+        if supervisor.state == ConnectionState.BACKING_OFF:
+            delays.append(supervisor.get_delay())
+    assert delays == [0.5, 1.0, 2.0, 4.0, 5.0, 5.0]
+    # long outages do not overflow the exponent
+    fail(supervisor, 2000)
+    assert supervisor.get_delay() == 5.0
+
+
+def test_jitter_only_shortens_the_delay():
+    supervisor = ConnectionSupervisor(failures_before_backoff=1, initial_delay=2.0, jitter=0.5)
+    fail(supervisor, 1)
+    for _ in range(100):
+        assert 1.0 <= supervisor.get_delay() <= 2.0
+
+
+def test_success_recovers_to_connected():
+    supervisor = ConnectionSupervisor(failures_before_backoff=2)
+    supervisor.record_success()
+    assert supervisor.reconnects == 0
+    fail(supervisor, 5)
+    supervisor.record_success()
+    assert supervisor.state == ConnectionState.CONNECTED
+    assert supervisor.consecutive_failures == 0
+    assert supervisor.retry_at is None
+    assert supervisor.reconnects == 1
+    assert supervisor.total_failures == 5
+    # the backoff starts over after recovery
+    fail(supervisor, 1)
+    assert supervisor.state == ConnectionState.DEGRADED
+    assert supervisor.to_dict()['state'] == 'degraded'
@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+
+from disk_history import DiskHistoryStore, parse_time
+
+
+def fill(store, count, start=0):
+    for i in range(start, start + count):
+        store.append(1000.0 + i, np.arange(store.tc_count, dtype=np.float32) + i)
+
+
+def test_empty_store(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 3, segment_records=4)
+    assert store.count == 0
+    assert store.oldest_time is None
+    times, temperatures = store.read_range()
+    assert times.shape == (0,)
+    assert temperatures.shape == (3, 0)
+    assert store.read_range(index=1)[1].shape == (0,)
+
+
+def test_read_range_across_segments(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 2, segment_records=4)
+    fill(store, 10)
+    assert store.count == 10
+    times, temperatures = store.read_range(1002, 1008)
+    np.testing.assert_array_equal(times, np.arange(1002, 1009))
+    np.testing.assert_array_equal(temperatures, [np.arange(2, 9), np.arange(3, 10)])
+    times, temperatures = store.read_range(time_from=1007.5, index=1)
+    np.testing.assert_array_equal(times, [1008, 1009])
+    np.testing.assert_array_equal(temperatures, [9, 10])
+
+
+def test_range_outside_of_history_is_empty(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 1, segment_records=4)
+    fill(store, 6)
+    assert len(store.read_range(time_from=2000)[0]) == 0
+    assert len(store.read_range(time_to=500)[0]) == 0
+
+
+def test_rotation_removes_oldest_segments(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 1, segment_records=4, max_segments=2)
+    fill(store, 13)
+    assert sorted(os.listdir(str(tmp_path))) == ['000000000008.seg', '000000000012.seg']
+    assert store.count == 13
+    assert store.oldest_time == 1008.0
+    times, _ = store.read_range()
+    np.testing.assert_array_equal(times, np.arange(1008, 1013))
+
+
+def test_reopen_continues_after_last_record(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 2, segment_records=4)
+    fill(store, 6)
+    store.close()
+    store = DiskHistoryStore(str(tmp_path), 2, segment_records=4)
+    assert store.count == 6
+    fill(store, 3, start=6)
+    times, temperatures = store.read_range()
+    np.testing.assert_array_equal(times, np.arange(1000, 1009))
+    np.testing.assert_array_equal(temperatures[1], np.arange(1, 10))
+
+
+def test_incompatible_segments_are_moved_aside(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 2, segment_records=4)
+    fill(store, 3)
+    store.close()
+    old_data = (tmp_path / '000000000000.seg').read_bytes()
+    store = DiskHistoryStore(str(tmp_path), 3, segment_records=4)
+    assert store.count == 0
+    fill(store, 2)
+    store.close()
+    assert (tmp_path / '000000000000.seg.incompatible').read_bytes() == old_data
+    # when the layout changes back, segments of the second layout are moved aside without replacing the first ones
+    store = DiskHistoryStore(str(tmp_path), 2, segment_records=4)
+    assert store.count == 0
+    assert sorted(os.listdir(str(tmp_path))) == ['000000000000.seg', '000000000000.seg.incompatible',
+                                                 '000000000000.seg.incompatible1']
+    assert (tmp_path / '000000000000.seg.incompatible').read_bytes() == old_data
+
+
+def test_parse_time():
+    assert parse_time(None) is None
+    assert parse_time('1500.5') == 1500.5
+    assert isinstance(parse_time('2020-05-01T10:00:00'), float)
+
+
+def test_iter_range_chunks(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 3, segment_records=5)
+    fill(store, 12)
+    chunks = list(store.iter_range(1001, 1010, index=[2, 0], chunk_records=2))
+    # chunks never span segments
+    assert [len(times) for times, _ in chunks] == [2, 2, 2, 2, 1, 1]
+    times = np.concatenate([times for times, _ in chunks])
+    temperatures = np.concatenate([temperatures for _, temperatures in chunks], axis=1)
+    np.testing.assert_array_equal(times, np.arange(1001, 1011))
+    np.testing.assert_array_equal(temperatures, [np.arange(3, 13), np.arange(1, 11)])
+
+
+def test_iter_range_excludes_records_appended_during_iteration(tmp_path):
+    store = DiskHistoryStore(str(tmp_path), 1, segment_records=4)
+    fill(store, 3)
+    chunks = store.iter_range(chunk_records=1)
+    next(chunks)
+    fill(store, 3, start=3)
+    assert sum(len(times) for times, _ in chunks) == 2
@@ -0,0 +1,49 @@
+import numpy as np
+
+from downsampling import minmax_downsample
+
+
+def test_short_series_is_returned_unchanged():
+    times = np.arange(5.0)
+    values = np.arange(5.0)
+    result_times, result_values = minmax_downsample(times, values, 10)
+    assert result_times is times
+    assert result_values is values
+
+
+def test_result_is_bounded_and_in_time_order():
+    rng = np.random.default_rng(3)
+    for length in (11, 100, 1001, 4096):
+        times = np.arange(length, dtype=np.float64)
+        values = rng.normal(size=length)
+        result_times, result_values = minmax_downsample(times, values, 100)
+        assert len(result_times) <= 100
+        assert np.all(np.diff(result_times) > 0)
+        np.testing.assert_array_equal(result_values, values[result_times.astype(int)])
+
+
+def test_peaks_are_preserved():
+    values = np.zeros(1000)
+    values[123] = 50.0
+    values[777] = -20.0
+    times = np.arange(1000.0)
+    result_times, result_values = minmax_downsample(times, values, 20)
+    assert 123.0 in result_times
+    assert 777.0 in result_times
+    assert result_values.max() == 50.0
+    assert result_values.min() == -20.0
+
+
+def test_bucket_extremes_are_kept():
+    values = np.array([3, 1, 2, 9, 5, 4, 7, 8], dtype=np.float64)
+    result_times, result_values = minmax_downsample(np.arange(8.0), values, 4)
+    np.testing.assert_array_equal(result_times, [1, 3, 5, 7])
+    np.testing.assert_array_equal(result_values, [1, 9, 4, 8])
+
+
+def test_unknown_values_are_skipped():
+    values = np.full(100, np.nan)
+    values[40] = 21.0
+    result_times, result_values = minmax_downsample(np.arange(100.0), values, 10)
+    assert 40.0 in result_times
+    assert len(result_times) <= 10
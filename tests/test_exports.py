@@ -0,0 +1,81 @@
+import csv
+import io
+import struct
+
+import numpy as np
+
+import exports
+from history import to_isoformat
+from thermocouple import Thermocouple
+
+tcs = [Thermocouple(0, 0, 7, 'Fixed'), Thermocouple(1, 0, 12, 'Fixed')]
+chunks = [
+    (np.array([1000.0, 1001.0]), np.array([[20.004, np.nan], [30.0, 31.5]], dtype=np.float32)),
+    (np.array([1002.0]), np.array([[21.0], [32.25]], dtype=np.float32)),
+]
+
+
+def test_history_csv():
+    data = b''.join(exports.history_csv_chunks(chunks, tcs)).decode()
+    lines = data.split('\r\n')
+    assert lines[-1] == ''
+    times = to_isoformat([1000.0, 1001.0, 1002.0])
+    assert lines[:-1] == [
+        'time,TC 7,TC 12',
+        f'{times[0]},20.00,30.00',
+        f'{times[1]},,31.50',
+        f'{times[2]},21.00,32.25',
+    ]
+
+
+def test_history_csv_of_empty_range():
+    assert b''.join(exports.history_csv_chunks([], tcs)) == b'time,TC 7,TC 12\r\n'
+
+
+def decode_history(data):
+    magic, version, count = struct.unpack_from('<4sHI', data)
+    offset = struct.calcsize('<4sHI')
+    labels = np.frombuffer(data, dtype='<i4', count=count, offset=offset)
+    offset += 4 * count
+    blocks = []
+    while True:
+        (length,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        if not length:
+            break
+        times = np.frombuffer(data, dtype='<f8', count=length, offset=offset)
+        offset += 8 * length
+        temperatures = np.frombuffer(data, dtype='<f4', count=count * length, offset=offset).reshape(count, length)
+        offset += 4 * count * length
+        blocks.append((times, temperatures))
+    assert offset == len(data)
+    return magic, version, labels, blocks
+
+
+def test_history_binary():
+    magic, version, labels, blocks = decode_history(b''.join(exports.history_binary_chunks(chunks, tcs)))
+    assert magic == b'MSDH'
+    assert version == 1
+    np.testing.assert_array_equal(labels, [7, 12])
+    assert len(blocks) == 2
+    for (times, temperatures), (expected_times, expected_temperatures) in zip(blocks, chunks):
+        np.testing.assert_array_equal(times, expected_times)
+        np.testing.assert_array_equal(temperatures, expected_temperatures)
+
+
+def test_history_binary_of_transposed_chunk():
+    # chunks of DiskHistoryStore.iter_range are transposed views of the records
+    temperatures = np.array([[1, 2], [3, 4], [5, 6]], dtype=np.float32).T
+    _, _, _, blocks = decode_history(b''.join(exports.history_binary_chunks([(np.arange(3.0), temperatures)], tcs)))
+    np.testing.assert_array_equal(blocks[0][1], [[1, 3, 5], [2, 4, 6]])
+
+
+def test_tests_csv_chunks():
+    tests = [dict(tcs[0].to_dict(), result='success', is_complete=True, extra='ignored') for _ in range(5)]
+    csv_chunks = list(exports.tests_csv_chunks(tests, chunk_rows=2))
+    assert len(csv_chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(b''.join(csv_chunks).decode())))
+    assert len(rows) == 5
+    assert tuple(rows[0]) == exports.test_columns
+    assert rows[0]['label'] == '7'
+    assert rows[0]['result'] == 'success'
@@ -0,0 +1,118 @@
+import datetime
+
+import numpy as np
+
+from history import HistoryStore
+
+
+def fill(store, count, start_time=1000.0, interval=0.2):
+    for i in range(count):
+        store.append(start_time + i * interval, np.arange(store.tc_count, dtype=np.float32) + i)
+
+
+def test_empty_store():
+    store = HistoryStore(3, capacity=4)
+    assert len(store) == 0
+    assert store.times.shape == (0,)
+    assert store.temperatures.shape == (3, 0)
+
+
+def test_window_before_wrap():
+    store = HistoryStore(2, capacity=5)
+    fill(store, 3)
+    assert len(store) == 3
+    np.testing.assert_allclose(store.times, [1000.0, 1000.2, 1000.4])
+    np.testing.assert_array_equal(store.temperatures, [[0, 1, 2], [1, 2, 3]])
+
+
+def test_window_after_wrap_keeps_newest_samples_in_order():
+    store = HistoryStore(2, capacity=4)
+    fill(store, 11)
+    assert store.count == 11
+    assert len(store) == 4
+    np.testing.assert_allclose(store.times, [1000.0 + i * 0.2 for i in range(7, 11)])
+    np.testing.assert_array_equal(store.temperatures[0], [7, 8, 9, 10])
+
+
+def test_window_is_a_view():
+    store = HistoryStore(2, capacity=4)
+    fill(store, 6)
+    assert np.shares_memory(store.temperatures, store._temperatures)
+    assert np.shares_memory(store.times, store._times)
+
+
+def test_thermocouple_history_rows():
+    store = HistoryStore(3, capacity=4)
+    fill(store, 2)
+    tc_history = store.get_tc_history(2)
+    assert len(tc_history) == 2
+    np.testing.assert_array_equal(tc_history.temperatures, [2, 3])
+    np.testing.assert_array_equal(tc_history.times, store.times)
+
+
+def test_unknown_temperatures_are_kept_as_nan():
+    store = HistoryStore(2, capacity=4)
+    store.append(1.0, np.array([np.nan, 20.5]))
+    assert np.isnan(store.temperatures[0, 0])
+    assert store.temperatures[1, 0] == np.float32(20.5)
+
+
+def reference_threshold_index(times, threshold_seconds):
+    older = [i for i, time in enumerate(times) if times[-1] - time > threshold_seconds]
+    return older[-1] if older else None
+
+
+def test_threshold_index_of_short_history():
+    store = HistoryStore(1, capacity=10)
+    assert store.find_threshold_index(datetime.timedelta(seconds=1)) is None
+    fill(store, 3, interval=1.0)
+    assert store.find_threshold_index(datetime.timedelta(seconds=5)) is None
+
+
+def test_threshold_index_matches_linear_search():
+    store = HistoryStore(1, capacity=16)
+    rng = np.random.default_rng(1)
+    time = 0.0
+    for _ in range(50):
+        time += float(rng.uniform(0.1, 1.0))
+        store.append(time, np.zeros(1))
+        times = store.times.tolist()
+        for seconds in (0.0, 0.5, 2.0, 7.5):
+            assert store.find_threshold_index(datetime.timedelta(seconds=seconds)) == \
+                reference_threshold_index(times, seconds)
+
+
+def test_threshold_index_excludes_sample_exactly_at_threshold():
+    store = HistoryStore(1, capacity=10)
+    fill(store, 5, start_time=0.0, interval=1.0)
+    assert store.find_threshold_index(datetime.timedelta(seconds=2)) == 1
+
+
+def test_threshold_index_cache_follows_appends():
+    store = HistoryStore(1, capacity=10)
+    fill(store, 3, start_time=0.0, interval=1.0)
+    threshold = datetime.timedelta(seconds=1.5)
+    assert store.find_threshold_index(threshold) == 0
+    store.append(3.0, np.zeros(1))
+    assert store.find_threshold_index(threshold) == 1
+
+
+def test_cursor_index_of_new_samples():
+    store = HistoryStore(1, capacity=5)
+    fill(store, 3)
+    cursor = store.count
+    assert store.find_cursor_index(cursor) == 3
+    fill(store, 4, start_time=2000.0)
+    start = store.find_cursor_index(cursor)
+    assert start == 1
+    np.testing.assert_allclose(store.times[start:], [2000.0 + i * 0.2 for i in range(4)])
+    assert store.find_cursor_index(store.count) == len(store)
+
+
+def test_cursor_out_of_buffer_or_invalid():
+    store = HistoryStore(1, capacity=5)
+    fill(store, 12)
+    assert store.find_cursor_index(7) == 0
+    assert store.find_cursor_index(6) is None
+    assert store.find_cursor_index(-1) is None
+    assert store.find_cursor_index(13) is None
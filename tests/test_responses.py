@@ -0,0 +1,63 @@
+import gzip
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from responses import compress_min_size, etag_matches, snapshot_response
+from snapshots import make_binary_snapshot, make_snapshot
+
+etag = '"0123456789abcdef"'
+
+
+def make_request(**headers):
+    return make_mocked_request('GET', '/heatmap-data', headers=headers)
+
+
+@pytest.mark.parametrize('header, matches', [
+    (None, False),
+    ('', False),
+    (etag, True),
+    ('W/' + etag, True),
+    ('*', True),
+    (' * ', True),
+    ('"fedcba9876543210", ' + etag, True),
+    ('"fedcba9876543210",W/' + etag + ' ,"0"', True),
+    ('"fedcba9876543210"', False),
+    ('"0123456789abcde"', False),
+    ('"0123456789abcdef0"', False),
+    ('0123456789abcdef', False),
+    ('"fedcba9876543210", "0"', False),
+])
+def test_etag_matches(header, matches):
+    request = make_request() if header is None else make_request(**{'If-None-Match': header})
+    assert etag_matches(request, etag) is matches
+
+
+def test_snapshot_response_not_modified():
+    snapshot = make_snapshot({'data': [1, 2, 3]})
+    with pytest.raises(web.HTTPNotModified) as raised:
+        snapshot_response(make_request(**{'If-None-Match': 'W/' + snapshot.etag}), snapshot)
+    assert raised.value.headers['ETag'] == snapshot.etag
+    assert raised.value.headers['Cache-Control'] == 'no-cache'
+
+
+def test_snapshot_response_body():
+    snapshot = make_snapshot({'data': [1, 2, 3]})
+    response = snapshot_response(make_request(**{'If-None-Match': '"other"'}), snapshot, 'max-age=60')
+    assert response.status == 200
+    assert response.body == snapshot.body
+    assert response.content_type == 'application/json'
+    assert response.headers['ETag'] == snapshot.etag
+    assert response.headers['Cache-Control'] == 'max-age=60'
+
+
+def test_snapshot_response_compressed_binary():
+    snapshot = make_binary_snapshot(bytes(compress_min_size))
+    response = snapshot_response(make_request(**{'Accept-Encoding': 'gzip, deflate'}), snapshot)
+    assert response.content_type == 'application/octet-stream'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.body) == snapshot.body
+    response = snapshot_response(make_request(), snapshot)
+    assert 'Content-Encoding' not in response.headers
+    assert response.body == snapshot.body
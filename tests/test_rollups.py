@@ -0,0 +1,70 @@
+import numpy as np
+
+from rollups import RollupLevel, RollupStore
+
+
+def test_bucket_statistics():
+    level = RollupLevel(2, 10, 5)
+    for time, temperatures in [(100, (20, np.nan)), (103, (26, 30)), (109, (23, np.nan)), (112, (40, 41))]:
+        level.add_sample(float(time), np.array(temperatures, dtype=np.float64))
+    assert level.count == 1
+    times, stats = level.read_range(100, 120, 0)
+    np.testing.assert_array_equal(times, [100, 110])
+    np.testing.assert_allclose(stats['min'], [20, 40])
+    np.testing.assert_allclose(stats['max'], [26, 40])
+    np.testing.assert_allclose(stats['mean'], [23, 40])
+    np.testing.assert_allclose(stats['last'], [23, 40])
+    _, stats = level.read_range(100, 120, 1)
+    np.testing.assert_allclose(stats['mean'], [30, 41])
+    np.testing.assert_allclose(stats['last'], [30, 41])
+
+
+def test_bucket_without_known_temperature_is_nan():
+    level = RollupLevel(1, 1, 5)
+    level.add_sample(0.0, np.array([np.nan]))
+    level.add_sample(1.0, np.array([20.0]))
+    _, stats = level.read_range(0, 1, 0)
+    for name in ('min', 'max', 'mean', 'last'):
+        assert np.isnan(stats[name][0])
+        assert stats[name][1] == 20.0
+
+
+def test_read_range_bounds():
+    level = RollupLevel(1, 10, 20)
+    for time in range(0, 100):
+        level.add_sample(float(time), np.array([float(time)]))
+    # the range start is aligned down to its bucket
+    times, stats = level.read_range(25, 50, 0)
+    np.testing.assert_array_equal(times, [20, 30, 40, 50])
+    np.testing.assert_allclose(stats['max'], [29, 39, 49, 59])
+    # the open bucket is only included if it starts within the range
+    times, _ = level.read_range(80, 95, 0)
+    np.testing.assert_array_equal(times, [80, 90])
+    times, _ = level.read_range(80, 85, 0)
+    np.testing.assert_array_equal(times, [80])
+
+
+def test_ring_buffer_keeps_newest_buckets():
+    level = RollupLevel(1, 1, 4)
+    assert level.oldest_time is None
+    for time in range(10):
+        level.add_sample(100.0 + time, np.array([float(time)]))
+    assert level.count == 9
+    assert level.oldest_time == 105.0
+    assert not level.covers(104.0)
+    assert level.covers(105.0)
+    times, stats = level.read_range(0, 200, 0)
+    np.testing.assert_array_equal(times, [105, 106, 107, 108, 109])
+    np.testing.assert_allclose(stats['last'], [5, 6, 7, 8, 9])
+
+
+def test_find_level_picks_most_detailed_level_within_point_budget():
+    store = RollupStore(1, resolutions=((1, 100), (10, 100)))
+    for time in range(500):
+        store.add_sample(float(time), np.array([0.0]))
+    fine, coarse = store.levels
+    assert store.find_level(450, 499, 60) is fine
+    # the fine level does not reach back that far
+    assert store.find_level(100, 150, 60) is coarse
+    # too many buckets for both levels
+    assert store.find_level(0, 499, 20) is None
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+import testing
+from connection import ConnectionState, ConnectionSupervisor
+from history import HistoryStore
+from snapshots import (build_heatmap_frame, frame_flag_error, frame_flag_stale, frame_header, frame_status_codes,
+                       get_side_snapshot)
+from thermocouple import Thermocouple
+
+geometry_version = bytes(range(8))
+
+
+def make_station(tc_count=10):
+    history = HistoryStore(tc_count, capacity=10)
+    tcs = []
+    for index in range(tc_count):
+        tc = Thermocouple(index % 5, index // 5, index + 1, 'Fixed')
+        tc.history = history.get_tc_history(index)
+        tc.update(20.0 + index, 0)
+        tcs.append(tc)
+    return SimpleNamespace(
+        get_side_tcs=lambda mold_side: tcs,
+        geometry_version=geometry_version,
+        frame_is_stale=False,
+        wlanbox=SimpleNamespace(connection=ConnectionSupervisor()),
+        mold_side_states={'Fixed': 'No error'},
+        test_session=testing.TestSession(),
+        state_version=0,
+        snapshots={},
+        tcs=tcs,
+    )
+
+
+def decode_frame(frame):
+    version, count, flags, error_length = frame_header.unpack_from(frame)
+    offset = frame_header.size
+    temperatures = np.frombuffer(frame, dtype='<f4', count=count, offset=offset)
+    offset += 4 * count
+    statuses = np.frombuffer(frame, dtype=np.uint8, count=count, offset=offset)
+    offset += count
+    bitmap_size = (count + 7) // 8
+    bitmaps = np.frombuffer(frame, dtype=np.uint8, count=3 * bitmap_size, offset=offset).reshape(3, bitmap_size)
+    test_states = np.unpackbits(bitmaps, axis=1, count=count, bitorder='little').astype(bool)
+    offset += 3 * bitmap_size
+    error = frame[offset:].decode()
+    assert len(frame) - offset == error_length
+    return version, flags, temperatures, statuses, test_states, error
+
+
+def confirm(station, tc, result):
+    test = testing.TcTest(tc, {'init_time': 0.0, 'start_time': 0.0, 'start_temperature': 20.0}, False)
+    test.result = result
+    station.test_session.test_results.add(test)
+
+
+def test_frame_layout():
+    station = make_station()
+    tcs = station.tcs
+    tcs[3].update(None, 67)
+    confirm(station, tcs[1], 'success')
+    confirm(station, tcs[9], 'fail')
+    station.test_session.new_tc_test(tcs[8], {'init_time': 0.0, 'start_time': 0.0, 'start_temperature': 28.0}, False)
+
+    version, flags, temperatures, statuses, test_states, error = decode_frame(build_heatmap_frame(station, 'Fixed'))
+    assert version == geometry_version
+    assert flags == 0
+    assert error == ''
+    expected = [20.0 + index for index in range(10)]
+    expected[3] = np.nan
+    np.testing.assert_array_equal(temperatures, np.array(expected, dtype=np.float32))
+    assert statuses[0] == frame_status_codes['OK']
+    assert statuses[3] == frame_status_codes['Disconnected']
+    np.testing.assert_array_equal(np.flatnonzero(test_states[0]), [1])
+    np.testing.assert_array_equal(np.flatnonzero(test_states[1]), [9])
+    np.testing.assert_array_equal(np.flatnonzero(test_states[2]), [8])
+
+
+def test_frame_of_side_with_error():
+    station = make_station(3)
+    station.frame_is_stale = True
+    station.mold_side_states['Fixed'] = 'Slave timeout'
+    version, flags, temperatures, statuses, test_states, error = decode_frame(build_heatmap_frame(station, 'Fixed'))
+    assert flags == frame_flag_stale | frame_flag_error
+    assert error == 'Slave timeout'
+    assert np.isnan(temperatures).all()
+    assert not statuses.any()
+    assert not test_states.any()
+
+
+def test_frame_of_unreachable_plc():
+    station = make_station(3)
+    station.wlanbox.connection.state = ConnectionState.BACKING_OFF
+    _, flags, _, _, _, error = decode_frame(build_heatmap_frame(station, 'Fixed'))
+    assert flags == frame_flag_error
+    assert error == 'PLC unreachable'
+
+
+def test_side_snapshot_is_rebuilt_on_new_state_version():
+    station = make_station(3)
+    snapshot = get_side_snapshot(station, 'Fixed')
+    assert get_side_snapshot(station, 'Fixed') is snapshot
+    assert snapshot.frame.text is None
+    heatmap = snapshot.heatmap
+    station.tcs[0].update(50.0, 0)
+    station.state_version += 1
+    rebuilt = get_side_snapshot(station, 'Fixed')
+    assert rebuilt is not snapshot
+    assert rebuilt.frame.etag != snapshot.frame.etag
+    assert rebuilt.heatmap.etag != heatmap.etag
+
+
+def test_side_snapshot_payloads_are_built_on_first_access():
+    station = make_station(3)
+    built = []
+    station.get_side_tcs = lambda mold_side: built.append(mold_side) or station.tcs
+    snapshot = get_side_snapshot(station, 'Fixed')
+    assert built == []
+    frame = snapshot.frame
+    assert len(built) == 1
+    assert snapshot.frame is frame
+    assert len(built) == 1
@@ -0,0 +1,245 @@
+import datetime
+import math
+from types import SimpleNamespace
+
+import numpy as np
+
+import testing
+from history import HistoryStore
+from thermocouple import Thermocouple
+
+
+def reference_rise(times, temperatures, detection_seconds):
+    """Rise of the last temperature over the newest minimum of the window after the last unknown temperature."""
+    if math.isnan(temperatures[-1]):
+        return math.nan, math.nan
+    minimum, min_time = math.inf, math.nan
+    for time, temperature in zip(times, temperatures):
+        if time < times[-1] - detection_seconds:
+            continue
+        if math.isnan(temperature):
+            minimum, min_time = math.inf, math.nan
+        elif temperature <= minimum:
+            minimum, min_time = temperature, time
+    return temperatures[-1] - minimum, min_time
+
+
+def test_streaming_detector_matches_reference():
+    detection_time = datetime.timedelta(seconds=3)
+    history = HistoryStore(4, capacity=40)
+    detector = testing.StreamingRiseDetector(4, detection_time, 5)
+    rng = np.random.default_rng(7)
+    time = 0.0
+    for _ in range(200):
+        time += float(rng.uniform(0.1, 0.5))
+        temperatures = rng.integers(20, 30, 4).astype(np.float32)
+        temperatures[rng.random(4) < 0.05] = np.nan
+        history.append(time, temperatures)
+        detector.update(history)
+        times = history.times.tolist()
+        for index in range(4):
+            rise, min_time = reference_rise(times, history.temperatures[index].tolist(), 3.0)
+            np.testing.assert_equal(detector.rise[index], rise)
+            np.testing.assert_equal(detector.min_times[index], min_time)
+
+
+def test_detects_rise_after_drop_within_window():
+    history = HistoryStore(2, capacity=20)
+    detector = testing.StreamingRiseDetector(2, datetime.timedelta(seconds=5), 3)
+    for time, temperatures in enumerate([(25, 25), (20, 25), (24, 26), (26, 27)]):
+        history.append(float(time), np.array(temperatures, dtype=np.float32))
+    detector.update(history)
+    np.testing.assert_allclose(detector.rise, [6, 2])
+    np.testing.assert_array_equal(detector.find_heated(np.array([True, True])), [0])
+    np.testing.assert_array_equal(detector.find_heated(np.array([False, True])), [])
+
+
+def test_find_heated_ranks_by_rise():
+    detector = testing.StreamingRiseDetector(4, datetime.timedelta(seconds=5), 3)
+    detector.rise = np.array([4.0, np.nan, 10.0, 2.0])
+    np.testing.assert_array_equal(detector.find_heated(np.ones(4, dtype=bool)), [2, 0])
+
+
+def test_detection_time_is_not_limited_by_history_buffer():
+    history = HistoryStore(1, capacity=5)
+    detector = testing.StreamingRiseDetector(1, datetime.timedelta(seconds=100), 5)
+    for time in range(20):
+        history.append(float(time), np.array([20.0 + time]))
+        detector.update(history)
+    # the window minimum has long fallen out of the history buffer
+    assert detector.rise[0] == 19.0
+    assert detector.min_times[0] == 0.0
+
+
+def test_detector_processes_only_new_samples():
+    history = HistoryStore(1, capacity=10)
+    detector = testing.StreamingRiseDetector(1, datetime.timedelta(seconds=5), 3)
+    history.append(0.0, np.array([20.0]))
+    detector.update(history)
+    detector.update(history)
+    assert len(detector.windows[0]) == 1
+    history.append(1.0, np.array([25.0]))
+    history.append(2.0, np.array([26.0]))
+    detector.update(history)
+    assert [sample[1] for sample in detector.windows[0]] == [20.0, 25.0, 26.0]
+    assert detector.count == history.count
+
+
+def test_sync_detector_rebuilds_on_config_change():
+    history = HistoryStore(1, capacity=10)
+    history.append(0.0, np.array([20.0]))
+    session = testing.TestSession()
+    config = SimpleNamespace(detection_time=datetime.timedelta(seconds=5), detection_degrees=3)
+    session.sync_detector(history, config)
+    detector = session.detector
+    assert detector.count == history.count
+    session.sync_detector(history, config)
+    assert session.detector is detector
+    config.detection_degrees = 4
+    session.sync_detector(history, config)
+    assert session.detector is not detector
+    assert session.detector.detection_degrees == 4
+
+
+def make_tcs(sides):
+    history = HistoryStore(len(sides), capacity=10)
+    tcs = []
+    for index, side in enumerate(sides):
+        tc = Thermocouple(index, 0, index + 1, side)
+        tc.history = history.get_tc_history(index)
+        tcs.append(tc)
+    return history, tcs
+
+
+def make_test(tc, result=None, start_temperature=20.0):
+    test = testing.TcTest(tc, {'init_time': 0.0, 'start_time': 0.0, 'start_temperature': start_temperature}, False)
+    test.result = result
+    return test
+
+
+def test_results_are_indexed_by_label_result_and_side():
+    _, tcs = make_tcs(['Fixed', 'Fixed', 'Moving'])
+    results = testing.TestResults()
+    tests = [make_test(tcs[0], 'success'), make_test(tcs[2], 'fail'), make_test(tcs[1], 'success')]
+    for test in tests:
+        results.add(test)
+    assert len(results) == 3
+    assert list(results) == tests
+    assert 2 in results and 4 not in results
+    assert results.get_result(3) == 'fail'
+    assert results.get_result(4) is None
+    assert results.get_labels('success') == [1, 2]
+    assert results.get_labels('unknown') == []
+    assert results.get_side_counts('Fixed') == {'tested': 2, 'success': 2, 'fail': 0}
+    assert results.get_side_counts('Moving') == {'tested': 1, 'success': 0, 'fail': 1}
+    assert results.get_side_counts('Other') == {'tested': 0, 'success': 0, 'fail': 0}
+    np.testing.assert_array_equal(results.get_tested_mask(4), [True, True, True, False])
+
+
+def test_results_replace_previous_result_of_thermocouple():
+    _, tcs = make_tcs(['Fixed', 'Fixed'])
+    results = testing.TestResults()
+    results.add(make_test(tcs[1], 'fail'))
+    retest = make_test(tcs[1], 'success')
+    results.add(retest)
+    assert len(results) == 1
+    assert results.get_labels('fail') == []
+    assert results.get_labels('success') == [2]
+    assert results.get_side_counts('Fixed') == {'tested': 1, 'success': 1, 'fail': 0}
+    np.testing.assert_array_equal(results.get_tested_mask(2), [False, True])
+    results.remove(2)
+    results.remove(2)
+    assert len(results) == 0
+    assert results.get_side_counts('Fixed') == {'tested': 0, 'success': 0, 'fail': 0}
+    assert not results.get_tested_mask(2).any()
+
+
+def test_side_counts_are_a_copy():
+    _, tcs = make_tcs(['Fixed'])
+    results = testing.TestResults()
+    results.add(make_test(tcs[0], 'success'))
+    results.get_side_counts('Fixed')['tested'] = 10
+    assert results.get_side_counts('Fixed')['tested'] == 1
+
+
+def make_heated_session(rises, sides):
+    """History of constant temperatures where the last sample of every thermocouple rises by rises."""
+    history, tcs = make_tcs(sides)
+    for time in range(10):
+        history.append(float(time), np.full(len(tcs), 20.0))
+    history.append(10.0, 20.0 + np.array(rises, dtype=np.float64))
+    for tc in tcs:
+        tc.update(float(tc.history.temperatures[-1]), 0)
+    config = SimpleNamespace(detection_method='window', detection_time=datetime.timedelta(seconds=3),
+                             detection_degrees=3, test_time=datetime.timedelta(seconds=60), test_degrees=10)
+    return testing.TestSession(), history, tcs, config
+
+
+def test_detection_finds_at_most_one_thermocouple_per_side():
+    session, history, tcs, config = make_heated_session([5, 8, 6, 0], ['Fixed', 'Fixed', 'Moving', 'Moving'])
+    active = np.ones(len(tcs), dtype=bool)
+    detections = session.detect_tested_tcs(tcs, history, active, config, {'Fixed', 'Moving'})
+    assert sorted(detection['tc'].label for detection in detections) == [2, 3]
+    fixed = next(detection for detection in detections if detection['tc'].mold_side == 'Fixed')
+    assert fixed['test_data'] == {'init_time': 6.0, 'start_time': 10.0, 'start_temperature': 28.0}
+    # only requested sides, active and untested thermocouples are detected
+    detections = session.detect_tested_tcs(tcs, history, active, config, {'Moving'})
+    assert [detection['tc'].label for detection in detections] == [3]
+    active[1] = False
+    detections = session.detect_tested_tcs(tcs, history, active, config, {'Fixed'})
+    assert [detection['tc'].label for detection in detections] == [1]
+    session.test_results.add(make_test(tcs[0], 'success'))
+    assert session.detect_tested_tcs(tcs, history, active, config, {'Fixed'}) == []
+
+
+def test_update_starts_tests_on_every_idle_side():
+    session, history, tcs, config = make_heated_session([5, 8, 6, 0], ['Fixed', 'Fixed', 'Moving', 'Moving'])
+    session.update(tcs, history, np.ones(len(tcs), dtype=bool), config)
+    assert session.get_lane('Fixed').current_test.tc is tcs[1]
+    assert session.get_lane('Moving').current_test.tc is tcs[2]
+    # a busy lane is not given another test
+    history.append(11.0, np.array([40.0, 28.0, 26.0, 40.0]))
+    session.update(tcs, history, np.ones(len(tcs), dtype=bool), config)
+    assert session.get_lane('Fixed').current_test.tc is tcs[1]
+    assert session.get_lane('Moving').current_test.tc is tcs[2]
+
+
+def test_confirm_test_of_lanes():
+    _, tcs = make_tcs(['Fixed', 'Moving'])
+    session = testing.TestSession()
+    assert not session.confirm_test('success')
+    for tc in tcs:
+        session.get_lane(tc.mold_side).completed_test = make_test(tc)
+    assert session.get_lane('Fixed').is_idle is False
+    # the lane has to be given while more than one test awaits confirmation
+    assert not session.confirm_test('success')
+    assert session.confirm_test('fail', 'Moving')
+    assert session.test_results.get_result(2) == 'fail'
+    assert session.get_lane('Moving').is_idle
+    assert session.confirm_test('success')
+    assert session.test_results.get_result(1) == 'success'
+    assert session.get_lane('Fixed').is_idle
+
+
+def test_confirmed_thermocouple_leaves_ordering():
+    _, tcs = make_tcs(['Fixed', 'Fixed', 'Fixed'])
+    for tc in tcs:
+        tc.update(20.0, 0)
+    session = testing.TestSession()
+    assert session.get_ordering(tcs) == (1, 2, 3)
+    session.get_lane('Fixed').completed_test = make_test(tcs[1])
+    session.confirm_test('success', 'Fixed')
+    assert session.get_ordering(tcs) == (1, 3)
+
+
+def test_ordering_is_cached_until_invalidated():
+    _, tcs = make_tcs(['Fixed', 'Fixed', 'Fixed'])
+    for tc in tcs:
+        tc.update(20.0, 0)
+    session = testing.TestSession()
+    ordering = session.get_ordering(tcs)
+    assert session.get_ordering(tcs) is ordering
+    tcs[0].update(None, 67)
+    assert session.get_ordering(tcs) is ordering
+    session.statuses_changed({'Fixed'})
+    assert session.get_ordering(tcs) == (2, 3)